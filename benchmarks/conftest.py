@@ -0,0 +1,16 @@
+import asyncio
+import os
+
+import pytest
+
+# Микробенчмаркам не нужны внешние сервисы, но модули epg читают настройки при импорте.
+os.environ.setdefault('DATABASE_URL', 'sqlite+aiosqlite:///:memory:')
+os.environ.setdefault('REDIS_URL', 'redis://localhost:6379')
+os.environ.setdefault('RATING_LIMIT_PER_DAY', '5')
+
+
+@pytest.fixture(scope='module')
+def loop():
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
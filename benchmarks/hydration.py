@@ -0,0 +1,63 @@
+"""
+Сравнение загрузки строк /list сущностями ORM sm.User и кортежами Row: память на строку и строк в секунду.
+
+    $ python -m benchmarks.hydration --rows 100000
+"""
+import argparse
+import gc
+import os
+import time
+import tracemalloc
+
+os.environ.setdefault('DATABASE_URL', 'sqlite+aiosqlite:///:memory:')
+os.environ.setdefault('REDIS_URL', 'redis://localhost:6379')
+os.environ.setdefault('RATING_LIMIT_PER_DAY', '5')
+
+from sqlalchemy import create_engine, insert, select  # noqa: E402
+from sqlalchemy.orm import Session  # noqa: E402
+
+from benchmarks.population import generate_users  # noqa: E402
+from epg.database import storage_models as sm  # noqa: E402
+from epg.endpoints.methods import USER_COLUMNS  # noqa: E402
+
+
+def measure(engine, statement, load, rows: int) -> dict:
+    gc.collect()
+    with Session(engine) as session:
+        started = time.perf_counter()
+        load(session, statement)
+        elapsed = time.perf_counter() - started
+
+    gc.collect()
+    tracemalloc.start()
+    with Session(engine) as session:
+        result = load(session, statement)
+        current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert len(result) == rows
+    return {'rows_per_second': rows / elapsed, 'bytes_per_row': current / rows}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Сравнение ORM и Row при загрузке /list')
+    parser.add_argument('--rows', type=int, default=100000)
+    args = parser.parse_args(argv)
+
+    engine = create_engine('sqlite://')
+    sm.Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(insert(sm.User), list(generate_users(args.rows)))
+
+    results = {
+        'orm': measure(engine, select(sm.User), lambda session, statement: session.scalars(statement).all(),
+                       args.rows),
+        'row': measure(engine, select(*USER_COLUMNS), lambda session, statement: session.execute(statement).all(),
+                       args.rows),
+    }
+    print(f"{'путь':<6}{'строк/с':>12}{'байт/строку':>14}")
+    for name, result in results.items():
+        print(f"{name:<6}{result['rows_per_second']:>12.0f}{result['bytes_per_row']:>14.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,334 @@
+"""
+Нагрузочный тест API.
+
+Создаёт временную базу SQLite с синтетическими пользователями, поднимает uvicorn с заглушкой SMTP
+и Redis и параллельно нагружает /api/list, /api/clients/{id}/match и /api/clients/create.
+Результаты (p50/p95/p99, запросы в секунду и ошибки) сохраняются в JSON. Ошибками считаются ответы
+с кодом не 2xx и ошибки соединения.
+
+Redis берётся из --redis-url, иначе запускается временный redis-server, если он установлен, иначе fakeredis.
+TCP-сервер fakeredis отправляет строку без переводов строки простой строкой RESP (+...\r\n), а redis.asyncio
+читает такой ответ через StreamReader.readline с пределом 64 КБ, поэтому закэшированные ответы /api/list
+больше 64 КБ не читаются. С fakeredis кэш /list выключается (LIST_CACHE_ENABLED=false), и это отмечается
+в отчёте.
+
+    $ python -m benchmarks.load --users 10000 --concurrency 32 --duration 20 --output results.json
+    $ python -m benchmarks.load --baseline results.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from io import BytesIO
+from typing import Callable, Optional
+
+import httpx
+from PIL import Image
+
+from benchmarks.population import ROOT, populate
+from benchmarks.smtp_stub import SMTPStub
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_redis_server() -> Optional[tuple[str, subprocess.Popen]]:
+    """
+    Запускает временный redis-server без сохранения данных на диск.
+
+    Returns:
+        Optional[tuple[str, subprocess.Popen]]: URL сервера и его процесс или None, если redis-server
+            не установлен.
+    """
+    executable = shutil.which('redis-server')
+    if not executable:
+        return None
+    port = free_port()
+    process = subprocess.Popen(
+        [executable, '--port', str(port), '--bind', '127.0.0.1', '--save', '', '--appendonly', 'no'],
+        stdout=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError('redis-server завершился при запуске')
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=0.5) as sock:
+                sock.sendall(b'PING\r\n')
+                if sock.recv(16).startswith(b'+PONG'):
+                    return f'redis://127.0.0.1:{port}', process
+        except OSError:
+            time.sleep(0.1)
+    process.terminate()
+    process.wait()
+    raise TimeoutError('redis-server не запустился')
+
+
+def start_fake_redis() -> str:
+    """
+    Запускает fakeredis в отдельном потоке.
+
+    Returns:
+        str: URL запущенного сервера.
+    """
+    from fakeredis import TcpFakeServer
+
+    port = free_port()
+    server = TcpFakeServer(('127.0.0.1', port))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f'redis://127.0.0.1:{port}'
+
+
+def avatar_bytes(size: int = 256) -> bytes:
+    output = BytesIO()
+    Image.new('RGB', (size, size), (120, 160, 200)).save(output, format='PNG')
+    return output.getvalue()
+
+
+def summarize(latencies: list[float], statuses: dict[int, int], errors: int, elapsed: float) -> dict:
+    """
+    Считает статистику по сценарию.
+
+    Args:
+        latencies (list[float]): Задержки запросов в секундах.
+        statuses (dict[int, int]): Количество ответов по кодам статуса.
+        errors (int): Количество запросов, завершившихся ошибкой соединения.
+        elapsed (float): Длительность сценария в секундах.
+
+    Returns:
+        dict: Статистика сценария. errors включает ответы с кодом не 2xx.
+    """
+    attempts = len(latencies) + errors
+    errors += sum(count for status, count in statuses.items() if not 200 <= status < 300)
+    result = {'requests': len(latencies), 'errors': errors, 'error_rate': errors / attempts if attempts else 0.0,
+              'statuses': statuses, 'rps': len(latencies) / elapsed if elapsed else 0.0}
+    if len(latencies) >= 2:
+        percentiles = statistics.quantiles(latencies, n=100, method='inclusive')
+        result.update(
+            mean_ms=statistics.fmean(latencies) * 1000,
+            p50_ms=percentiles[49] * 1000,
+            p95_ms=percentiles[94] * 1000,
+            p99_ms=percentiles[98] * 1000,
+        )
+    return result
+
+
+async def run_scenario(client: httpx.AsyncClient, make_request: Callable, concurrency: int, duration: float,
+                       max_requests: Optional[int]) -> dict:
+    """
+    Выполняет запросы сценария в concurrency параллельных потоках в течение duration секунд.
+
+    Args:
+        client (httpx.AsyncClient): HTTP-клиент.
+        make_request (Callable): Функция, выполняющая один запрос клиентом и возвращающая ответ.
+        concurrency (int): Количество параллельных потоков запросов.
+        duration (float): Длительность сценария в секундах.
+        max_requests (Optional[int]): Ограничение на общее количество запросов.
+
+    Returns:
+        dict: Статистика сценария.
+    """
+    latencies, statuses = [], {}
+    errors = 0
+    started = time.perf_counter()
+    deadline = started + duration
+
+    async def worker():
+        nonlocal errors
+        while time.perf_counter() < deadline and (max_requests is None or len(latencies) + errors < max_requests):
+            request_started = time.perf_counter()
+            try:
+                response = await make_request(client)
+            except httpx.HTTPError:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - request_started)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, statuses, errors, time.perf_counter() - started)
+
+
+def build_scenarios(users: int, seed: int) -> dict[str, Callable]:
+    rnd = random.Random(seed)
+    avatar = avatar_bytes()
+    created = iter(range(10 ** 9))
+
+    def email():
+        return f'user{rnd.randrange(users)}@example.com'
+
+    async def list_plain(client):
+        return await client.get('/api/list', params={'email': email()})
+
+    async def list_distance(client):
+        return await client.get('/api/list', params={'email': email(), 'distance': rnd.choice([5, 25, 100])})
+
+    async def list_name(client):
+        return await client.get('/api/list', params={'email': email(), 'first_name': 'ан', 'gender': 'female'})
+
+    async def match(client):
+        return await client.post(f'/api/clients/{rnd.randrange(users) + 1}/match', params={'email': email()})
+
+    async def create(client):
+        return await client.post(
+            '/api/clients/create',
+            files={'avatar': ('avatar.png', avatar, 'image/png')},
+            data={'gender': 'male', 'first_name': 'Load', 'last_name': 'Test',
+                  'email': f'load{seed}_{next(created)}@example.com', 'password': 'password',
+                  'latitude': rnd.uniform(55, 56), 'longitude': rnd.uniform(37, 38)},
+        )
+
+    return {'list': list_plain, 'list_distance': list_distance, 'list_name': list_name,
+            'match': match, 'create': create}
+
+
+async def wait_ready(client: httpx.AsyncClient, process: subprocess.Popen, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError('uvicorn завершился при запуске')
+        try:
+            await client.get('/api/openapi.json')
+            return
+        except httpx.TransportError:
+            await asyncio.sleep(0.2)
+    raise TimeoutError('uvicorn не запустился')
+
+
+async def run(args: argparse.Namespace) -> dict:
+    with tempfile.TemporaryDirectory(prefix='epg-bench-') as workdir:
+        return await run_in(workdir, args)
+
+
+async def run_in(workdir: str, args: argparse.Namespace) -> dict:
+    db_path = os.path.join(workdir, 'bench.db')
+    print(f'Генерация {args.users} пользователей в {db_path}', file=sys.stderr)
+    populate(f'sqlite:///{db_path}', args.users, seed=args.seed)
+
+    smtp = SMTPStub()
+    await smtp.start()
+    redis_process = None
+    overrides = {}
+    if args.redis_url:
+        redis_url, redis_mode = args.redis_url, 'external'
+    elif server := start_redis_server():
+        (redis_url, redis_process), redis_mode = server, 'redis-server'
+    else:
+        print('redis-server не найден, используется fakeredis с выключенным кэшем /list: '
+              'redis.asyncio не читает из его TCP-сервера ответы длиннее 64 КБ', file=sys.stderr)
+        redis_url, redis_mode = start_fake_redis(), 'fakeredis'
+        overrides['LIST_CACHE_ENABLED'] = 'false'
+    port = free_port()
+    env = {
+        **os.environ,
+        'DATABASE_URL': f'sqlite+aiosqlite:///{db_path}',
+        'REDIS_URL': redis_url,
+        'SMTP_SERVER': smtp.host,
+        'PORT': str(smtp.port),
+        'SMTP_USE_TLS': 'false',
+        'SMTP_EMAIL_FROM': 'bench@example.com',
+        'SMTP_EMAIL_FROM_PASSWORD': 'bench',
+        'RATING_LIMIT_PER_DAY': str(10 ** 9),
+        'IMAGES_DIR': os.path.join(workdir, 'images'),
+        **overrides,
+    }
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'epg.endpoints:app', '--port', str(port),
+         '--workers', str(args.workers), '--log-level', 'warning'],
+        cwd=ROOT, env=env,
+    )
+    limits = httpx.Limits(max_connections=args.concurrency)
+    results = {}
+    try:
+        async with httpx.AsyncClient(base_url=f'http://127.0.0.1:{port}', limits=limits, timeout=60) as client:
+            await wait_ready(client, process)
+            scenarios = build_scenarios(args.users, args.seed)
+            for name in args.scenarios:
+                print(f'Сценарий {name}...', file=sys.stderr)
+                results[name] = await run_scenario(client, scenarios[name], args.concurrency, args.duration,
+                                                   args.max_requests)
+    finally:
+        process.terminate()
+        process.wait()
+        if redis_process:
+            redis_process.terminate()
+            redis_process.wait()
+        await smtp.stop()
+
+    return {
+        'config': {'users': args.users, 'concurrency': args.concurrency, 'duration': args.duration,
+                   'workers': args.workers, 'seed': args.seed, 'redis': redis_mode,
+                   'list_cache': env.get('LIST_CACHE_ENABLED', 'true').lower() != 'false'},
+        'environment': {'python': platform.python_version(), 'platform': platform.platform(),
+                        'cpus': os.cpu_count()},
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'emails_sent': smtp.messages,
+        'scenarios': results,
+    }
+
+
+def print_report(report: dict, baseline: Optional[dict] = None):
+    print(f"{'сценарий':<15}{'rps':>10}{'p50 мс':>10}{'p95 мс':>10}{'p99 мс':>10}{'ошибки':>8}{'%':>7}")
+    for name, result in report['scenarios'].items():
+        line = (f"{name:<15}{result['rps']:>10.1f}{result.get('p50_ms', 0):>10.1f}"
+                f"{result.get('p95_ms', 0):>10.1f}{result.get('p99_ms', 0):>10.1f}{result['errors']:>8}"
+                f"{result['error_rate'] * 100:>7.1f}")
+        previous = (baseline or {}).get('scenarios', {}).get(name)
+        if previous and previous.get('rps') and previous.get('p95_ms'):
+            line += (f"   rps {(result['rps'] / previous['rps'] - 1) * 100:+.1f}%,"
+                     f" p95 {(result.get('p95_ms', 0) / previous['p95_ms'] - 1) * 100:+.1f}%")
+        print(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Нагрузочный тест API epg')
+    parser.add_argument('--users', type=int, default=10000, help='Размер синтетической выборки пользователей')
+    parser.add_argument('--concurrency', type=int, default=16, help='Количество параллельных клиентов')
+    parser.add_argument('--duration', type=float, default=10, help='Длительность каждого сценария в секундах')
+    parser.add_argument('--max-requests', type=int, help='Ограничение количества запросов на сценарий')
+    parser.add_argument('--workers', type=int, default=1, help='Количество воркеров uvicorn')
+    parser.add_argument('--scenarios', nargs='+', default=['list', 'list_distance', 'list_name', 'match', 'create'],
+                        choices=['list', 'list_distance', 'list_name', 'match', 'create'])
+    parser.add_argument('--redis-url', help='URL Redis (по умолчанию временный redis-server или fakeredis)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='Файл для сохранения результатов в JSON')
+    parser.add_argument('--baseline', help='JSON предыдущего запуска для сравнения')
+    parser.add_argument('--max-error-rate', type=float, default=0.01,
+                        help='Допустимая доля ошибок в сценарии, при превышении код выхода 1')
+    args = parser.parse_args(argv)
+
+    report = asyncio.run(run(args))
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as file:
+            baseline = json.load(file)
+    print_report(report, baseline)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+
+    failed = [name for name, result in report['scenarios'].items() if result['error_rate'] > args.max_error_rate]
+    if failed:
+        for name in failed:
+            result = report['scenarios'][name]
+            statuses = ', '.join(f'{status}: {count}' for status, count in sorted(result['statuses'].items()))
+            print(f"Сценарий {name}: доля ошибок {result['error_rate']:.1%} больше {args.max_error_rate:.1%}"
+                  f" ({statuses})", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+import datetime
+import os
+import random
+from typing import Iterator
+
+import bcrypt
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import create_engine, insert
+
+from epg.database import storage_models as sm
+
+ROOT = os.path.join(os.path.dirname(__file__), '..')
+
+# Центры населённых пунктов (широта, долгота, вес) для генерации правдоподобных координат.
+CITIES = [
+    (55.7558, 37.6173, 0.35),
+    (59.9343, 30.3351, 0.2),
+    (55.0084, 82.9357, 0.1),
+    (56.8389, 60.6057, 0.1),
+    (55.7887, 49.1221, 0.1),
+    (43.5855, 39.7231, 0.15),
+]
+FIRST_NAMES = ['Иван', 'Пётр', 'Анна', 'Мария', 'Алексей', 'Ольга', 'Дмитрий', 'Елена', 'Сергей', 'Наталья']
+LAST_NAMES = ['Иванов', 'Петров', 'Сидоров', 'Смирнов', 'Кузнецов', 'Попов', 'Соколов', 'Лебедев']
+PASSWORD = 'password'
+
+
+def create_schema(sync_url: str):
+    """
+    Создаёт схему базы данных миграциями alembic.
+
+    Args:
+        sync_url (str): Синхронный URL базы данных.
+    """
+    config = Config(os.path.join(ROOT, 'alembic.ini'))
+    config.set_main_option('script_location', os.path.join(ROOT, 'epg/database/alembic'))
+    os.environ['SYNC_DATABASE_URL'] = sync_url
+    command.upgrade(config, 'head')
+
+
+def generate_users(count: int, seed: int = 0) -> Iterator[dict]:
+    """
+    Генерирует синтетических пользователей с координатами вокруг крупных городов.
+
+    Все пользователи получают один и тот же хеш пароля, чтобы генерация не упиралась в bcrypt.
+
+    Args:
+        count (int): Количество пользователей.
+        seed (int): Начальное значение генератора случайных чисел.
+
+    Yields:
+        dict: Параметры для вставки в таблицу users. Почта имеет вид user{i}@example.com.
+    """
+    rnd = random.Random(seed)
+    password = bcrypt.hashpw(PASSWORD.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+    weights = [city[2] for city in CITIES]
+    start = datetime.datetime(2024, 1, 1)
+    for i in range(count):
+        latitude, longitude, _ = rnd.choices(CITIES, weights)[0]
+        yield {
+            'avatar': 'resources/images/benchmark.png',
+            'gender': rnd.choice(['male', 'female']),
+            'first_name': rnd.choice(FIRST_NAMES),
+            'last_name': rnd.choice(LAST_NAMES),
+            'email': f'user{i}@example.com',
+            'password': password,
+            'date': start + datetime.timedelta(minutes=i),
+            'latitude': rnd.gauss(latitude, 0.15),
+            'longitude': rnd.gauss(longitude, 0.25),
+        }
+
+
+def populate(sync_url: str, count: int, seed: int = 0, batch_size: int = 5000):
+    """
+    Создаёт схему и заполняет базу данных синтетическими пользователями.
+
+    Args:
+        sync_url (str): Синхронный URL базы данных.
+        count (int): Количество пользователей.
+        seed (int): Начальное значение генератора случайных чисел.
+        batch_size (int): Количество записей в одной вставке.
+    """
+    create_schema(sync_url)
+    engine = create_engine(sync_url)
+    batch = []
+    with engine.begin() as conn:
+        for user in generate_users(count, seed):
+            batch.append(user)
+            if len(batch) >= batch_size:
+                conn.execute(insert(sm.User), batch)
+                batch = []
+        if batch:
+            conn.execute(insert(sm.User), batch)
+    engine.dispose()
@@ -0,0 +1,80 @@
+"""
+Скорость записи оценок: отдельная транзакция на каждую оценку против групповой фиксации RatingWriter.
+
+    $ python -m benchmarks.ratings --likes 5000 --concurrency 64 --window-ms 5
+"""
+import argparse
+import asyncio
+import datetime
+import os
+import tempfile
+import time
+
+os.environ.setdefault('REDIS_URL', 'redis://localhost:6379')
+os.environ.setdefault('RATING_LIMIT_PER_DAY', '5')
+
+from sqlalchemy import create_engine, delete, insert  # noqa: E402
+
+from benchmarks.population import generate_users  # noqa: E402
+from epg.batching import RatingWriter  # noqa: E402
+from epg.database import storage_models as sm  # noqa: E402
+from epg.dependencies import Database  # noqa: E402
+
+
+async def run(pairs: list[tuple[int, int]], concurrency: int, like) -> float:
+    queue = iter(pairs)
+
+    async def worker():
+        for rater_id, rated_id in queue:
+            await like(rater_id, rated_id)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return len(pairs) / (time.perf_counter() - started)
+
+
+async def measure(url: str, pairs: list[tuple[int, int]], concurrency: int, window: float) -> dict:
+    database = Database(url)
+
+    async def direct(rater_id, rated_id):
+        async for session in database():
+            session.add(sm.Rating(rater_id=rater_id, rated_id=rated_id, date=datetime.datetime.now()))
+            await session.commit()
+
+    results = {'direct': await run(pairs, concurrency, direct)}
+    async with database.engine.begin() as conn:
+        await conn.execute(delete(sm.Rating))
+
+    writer = RatingWriter(database, window=window)
+    writer.start()
+    results['group_commit'] = await run(
+        pairs, concurrency, lambda rater_id, rated_id: writer.add(rater_id, rated_id, datetime.datetime.now()))
+    await writer.stop()
+    await database.dispose()
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Скорость записи оценок')
+    parser.add_argument('--likes', type=int, default=5000)
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--window-ms', type=float, default=5)
+    args = parser.parse_args(argv)
+
+    users = int(args.likes ** 0.5) + 2
+    pairs = [(rater, rated) for rater in range(1, users + 1) for rated in range(1, users + 1) if rater != rated]
+    pairs = pairs[:args.likes]
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'ratings.db')
+        engine = create_engine(f'sqlite:///{path}')
+        sm.Base.metadata.create_all(engine)
+        with engine.begin() as conn:
+            conn.execute(insert(sm.User), list(generate_users(users)))
+        engine.dispose()
+        results = asyncio.run(measure(f'sqlite+aiosqlite:///{path}', pairs, args.concurrency, args.window_ms / 1000))
+    for name, rate in results.items():
+        print(f"{name:>12}: {rate:.0f} оценок/с")
+
+
+if __name__ == '__main__':
+    main()
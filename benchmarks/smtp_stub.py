@@ -0,0 +1,58 @@
+import asyncio
+
+
+class SMTPStub:
+    """
+    Минимальный SMTP-сервер, принимающий любые письма без отправки. Используется в нагрузочных тестах
+    вместо настоящего SMTP-сервера.
+
+    Args:
+        host (str): Адрес для прослушивания.
+        port (int): Порт для прослушивания, 0 — выбрать свободный.
+
+    Attributes:
+        messages (int): Количество принятых писем.
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0):
+        self.host = host
+        self.port = port
+        self.messages = 0
+        self._server = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        writer.write(b'220 stub ESMTP\r\n')
+        in_data = False
+        try:
+            while line := await reader.readline():
+                if in_data:
+                    if line == b'.\r\n':
+                        in_data = False
+                        self.messages += 1
+                        writer.write(b'250 OK\r\n')
+                    continue
+                command = line[:4].upper()
+                if command in (b'EHLO', b'HELO'):
+                    writer.write(b'250-stub\r\n250 AUTH PLAIN LOGIN\r\n')
+                elif command == b'AUTH':
+                    writer.write(b'235 Authentication successful\r\n')
+                elif command == b'DATA':
+                    in_data = True
+                    writer.write(b'354 End data with <CR><LF>.<CR><LF>\r\n')
+                elif command == b'QUIT':
+                    writer.write(b'221 Bye\r\n')
+                    await writer.drain()
+                    break
+                else:
+                    writer.write(b'250 OK\r\n')
+                await writer.drain()
+        finally:
+            writer.close()
@@ -0,0 +1,67 @@
+"""
+Время импорта приложения и задержка первого запроса с прогревом в lifespan и без него.
+
+Каждый замер выполняется в отдельном процессе на временной базе SQLite, выводятся медианы.
+
+    $ python -m benchmarks.startup --runs 10
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+from benchmarks.population import ROOT, populate
+
+PROBE = '''
+import json, sys, time
+started = time.perf_counter()
+from epg.endpoints import app
+imported = time.perf_counter()
+from fastapi.testclient import TestClient
+warm = sys.argv[1] == 'warm'
+client = TestClient(app)
+if warm:
+    client.__enter__()
+ready = time.perf_counter()
+response = client.get('/api/list', params={'email': 'user0@example.com'})
+first = time.perf_counter()
+assert response.status_code == 200, response.status_code
+if warm:
+    client.__exit__(None, None, None)
+print(json.dumps({'import': imported - started, 'startup': ready - imported, 'first_request': first - ready}))
+'''
+
+
+def probe(mode: str, env: dict) -> dict:
+    output = subprocess.run([sys.executable, '-c', PROBE, mode], env=env, cwd=ROOT, check=True,
+                            capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Время импорта и первого запроса')
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--users', type=int, default=1000)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'startup.db')
+        populate(f'sqlite:///{path}', args.users)
+        env = {
+            **os.environ,
+            'DATABASE_URL': f'sqlite+aiosqlite:///{path}',
+            'REDIS_URL': os.environ.get('REDIS_URL', 'redis://localhost:6399'),
+            'RATING_LIMIT_PER_DAY': '5',
+        }
+        for mode in ('cold', 'warm'):
+            results = [probe(mode, env) for _ in range(args.runs)]
+            medians = {name: statistics.median(result[name] for result in results) * 1000 for name in results[0]}
+            print(f"{mode:>4}: импорт {medians['import']:.0f} мс, запуск {medians['startup']:.0f} мс, "
+                  f"первый запрос {medians['first_request']:.1f} мс")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+"""
+Микробенчмарки горячих функций. Запуск и сравнение с сохранённым базовым замером — через make bench-baseline
+и make bench (см. Makefile).
+"""
+import datetime
+import json
+import random
+from io import BytesIO
+
+import fakeredis
+import pytest
+from fastapi.encoders import jsonable_encoder
+from PIL import Image
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.orm import Session
+
+from benchmarks.population import generate_users
+from epg import utils
+from epg.database import api_models as am
+from epg.database import storage_models as sm
+from epg.dependencies import Storage
+from epg.endpoints import clients, methods
+
+
+@pytest.fixture(scope='module')
+def storage(loop):
+    storage = Storage('redis://localhost:6379')
+    storage.client = fakeredis.aioredis.FakeRedis()
+    yield storage
+    loop.run_until_complete(storage.client.aclose())
+
+
+@pytest.fixture()
+def fake_storage(monkeypatch, storage, loop):
+    loop.run_until_complete(storage.client.flushall())
+    monkeypatch.setattr(utils, 'storage', storage)
+    return storage
+
+
+def test_calculate_distance_cold(benchmark, fake_storage, loop):
+    rnd = random.Random(0)
+
+    def run():
+        return loop.run_until_complete(
+            utils.calculate_distance(rnd.uniform(-90, 90), rnd.uniform(-180, 180),
+                                     rnd.uniform(-90, 90), rnd.uniform(-180, 180)))
+
+    benchmark(run)
+
+
+def test_calculate_distance_warm(benchmark, fake_storage, loop):
+    coordinates = (55.7558, 37.6173, 59.9343, 30.3351)
+    loop.run_until_complete(utils.calculate_distance(*coordinates))
+
+    distance = benchmark(lambda: loop.run_until_complete(utils.calculate_distance(*coordinates)))
+    assert 630 < distance < 640
+
+
+@pytest.mark.parametrize('size', [128, 512, 2048])
+def test_add_watermark(benchmark, monkeypatch, tmp_path, size):
+    monkeypatch.setattr(clients, 'images_path', str(tmp_path))
+    output = BytesIO()
+    Image.effect_noise((size, size), 64).convert('RGB').save(output, format='PNG')
+
+    benchmark(clients.add_watermark, output.getvalue())
+
+
+def test_api_user_construction(benchmark):
+    fields = dict(gender='male', first_name='John', last_name='Doe', email='john@example.com',
+                  password='TestPassword123', latitude=55.75, longitude=37.61)
+
+    user = benchmark.pedantic(am.User, kwargs=fields, rounds=5, iterations=1)
+    assert user.password != fields['password']
+
+
+@pytest.fixture(scope='module')
+def users_engine():
+    engine = create_engine('sqlite://')
+    sm.Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(insert(sm.User), list(generate_users(1000)))
+    yield engine
+    engine.dispose()
+
+
+def test_storage_user_hydration(benchmark, users_engine):
+    def hydrate():
+        with Session(users_engine) as session:
+            return session.scalars(select(sm.User)).all()
+
+    users = benchmark(hydrate)
+    assert len(users) == 1000
+    assert isinstance(users[0].date, datetime.datetime)
+
+
+def test_list_row_hydration(benchmark, users_engine):
+    def hydrate():
+        with Session(users_engine) as session:
+            return session.execute(select(*methods.USER_COLUMNS)).all()
+
+    rows = benchmark(hydrate)
+    assert len(rows) == 1000
+    assert isinstance(rows[0].date, datetime.datetime)
+
+
+@pytest.fixture(scope='module')
+def list_engine():
+    engine = create_engine('sqlite://')
+    sm.Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(insert(sm.User), list(generate_users(10000)))
+    yield engine
+    engine.dispose()
+
+
+def _legacy_serialize(users) -> bytes:
+    # Сериализация /list до появления am.UserList: jsonable_encoder по pydantic-датаклассам sm.User.
+    return json.dumps(jsonable_encoder({"users": users}), ensure_ascii=False, separators=(",", ":")).encode()
+
+
+@pytest.mark.parametrize('serializer', [_legacy_serialize, methods.serialize_users], ids=['legacy', 'orjson'])
+def test_list_serialization(benchmark, list_engine, serializer):
+    with Session(list_engine) as session:
+        if serializer is methods.serialize_users:
+            users = session.execute(select(*methods.USER_COLUMNS)).all()
+        else:
+            users = session.scalars(select(sm.User)).all()
+
+    body = benchmark(serializer, users)
+    assert len(json.loads(body)['users']) == 10000
@@ -0,0 +1,196 @@
+import asyncio
+import datetime
+import logging
+import os
+from contextlib import asynccontextmanager
+from typing import Optional
+
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+
+from epg import metrics
+from epg.database import storage_models as sm
+from epg.dependencies import Database, database
+from epg.retention import existing_pairs
+
+logger = logging.getLogger(__name__)
+
+RATING_BATCH_SIZE = metrics.registry.histogram(
+    'epg_rating_batch_size', 'Количество оценок, зафиксированных одной транзакцией', (),
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500))
+
+
+def duplicate_rating(rater_id: int, rated_id: int) -> IntegrityError:
+    return IntegrityError('INSERT INTO ratings', {'rater_id': rater_id, 'rated_id': rated_id},
+                          Exception('Оценка уже существует'))
+
+
+def _resolve(future: asyncio.Future, error: Optional[Exception] = None):
+    # Запрос могли отменить, пока пакет записывался.
+    if future.done():
+        return
+    if error is None:
+        future.set_result(None)
+    else:
+        future.set_exception(error)
+
+
+class RatingWriter:
+    """
+    Групповая фиксация оценок.
+
+    Оценки от одновременных запросов собираются в очередь, и отдельная задача раз в window секунд
+    (или по достижении max_batch) записывает их одной транзакцией. Каждый вызывающий получает собственный
+    результат: повторная оценка, в том числе внутри одного пакета или уже перенесённая в архив, завершается
+    IntegrityError, как и при записи отдельной транзакцией.
+
+    Args:
+        database (Database): База данных.
+        window (float): Сколько секунд собирать пакет после первой оценки.
+        max_batch (int): Максимальное количество оценок в пакете.
+        enabled (bool): Запускать ли задачу записи в lifespan.
+    """
+
+    def __init__(self, database: Database, window: float = 0.005, max_batch: int = 500, enabled: bool = False):
+        self.database = database
+        self.window = window
+        self.max_batch = max_batch
+        self.enabled = enabled
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def started(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def add(self, rater_id: int, rated_id: int, date: datetime.datetime):
+        """
+        Ставит оценку в очередь и ждёт фиксации пакета. Если задача записи не запущена или уже остановлена,
+        оценка записывается отдельной транзакцией.
+
+        Raises:
+            IntegrityError: Если оценка уже существует.
+        """
+        item = ({'rater_id': rater_id, 'rated_id': rated_id, 'date': date},
+                asyncio.get_running_loop().create_future())
+        with metrics.stage('db'):
+            if self.started:
+                self._queue.put_nowait(item)
+            else:
+                await self._flush_one_by_one([item])
+            await item[1]
+
+    def start(self):
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """
+        Останавливает задачу и записывает оценки, оставшиеся в очереди, в том числе поставленные
+        после сигнала остановки.
+        """
+        try:
+            if self.started:
+                self._queue.put_nowait(None)
+                await self._task
+        finally:
+            self._task = None
+            if self._queue is not None:
+                remaining = []
+                while not self._queue.empty():
+                    if (item := self._queue.get_nowait()) is not None:
+                        remaining.append(item)
+                if remaining:
+                    await self._flush(remaining)
+
+    @asynccontextmanager
+    async def running(self):
+        """
+        Запускает задачу записи на время блока, если групповая фиксация включена.
+        """
+        if self.enabled:
+            self.start()
+        try:
+            yield self
+        finally:
+            await self.stop()
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = loop.time() + self.window
+            while len(batch) < self.max_batch:
+                try:
+                    item = self._queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(self._queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            await self._flush(batch)
+
+    async def _flush(self, batch: list[tuple[dict, asyncio.Future]]):
+        pending = [(values, future) for values, future in batch if not future.done()]
+        accepted, seen = [], set()
+        for values, future in pending:
+            pair = (values['rater_id'], values['rated_id'])
+            if pair in seen:
+                _resolve(future, duplicate_rating(*pair))
+            else:
+                seen.add(pair)
+                accepted.append((values, future))
+        if not accepted:
+            return
+
+        try:
+            async with self.database.engine.begin() as conn:
+                existing = set((await conn.execute(existing_pairs(seen))).all())
+                rows = [values for values, _ in accepted if (values['rater_id'], values['rated_id']) not in existing]
+                if rows:
+                    await conn.execute(insert(sm.Rating), rows)
+        except IntegrityError:
+            # Оценку из пакета успели записать в обход очереди: записываем пакет по одной.
+            await self._flush_one_by_one(accepted)
+            return
+        except Exception as error:
+            logger.exception("Не удалось записать пакет оценок")
+            for _, future in accepted:
+                _resolve(future, error)
+            return
+
+        RATING_BATCH_SIZE.observe(len(rows))
+        for values, future in accepted:
+            if (values['rater_id'], values['rated_id']) in existing:
+                _resolve(future, duplicate_rating(values['rater_id'], values['rated_id']))
+            else:
+                _resolve(future)
+
+    async def _flush_one_by_one(self, accepted: list[tuple[dict, asyncio.Future]]):
+        for values, future in accepted:
+            try:
+                async with self.database.engine.begin() as conn:
+                    await conn.execute(insert(sm.Rating), values)
+            except Exception as error:
+                _resolve(future, error)
+            else:
+                _resolve(future)
+
+
+rating_writer = RatingWriter(
+    database,
+    window=float(os.environ.get('RATING_GROUP_COMMIT_WINDOW_MS', 5)) / 1000,
+    max_batch=int(os.environ.get('RATING_GROUP_COMMIT_MAX_BATCH', 500)),
+    enabled=os.environ.get('RATING_GROUP_COMMIT', '').lower() in ('1', 'true', 'yes'),
+)
@@ -0,0 +1,110 @@
+import hashlib
+import json
+import logging
+import os
+from typing import Optional, Sequence
+
+import redis.asyncio as redis
+
+from epg import metrics
+from epg.dependencies import Storage, storage
+
+logger = logging.getLogger(__name__)
+
+LIST_CACHE_REQUESTS = metrics.registry.counter(
+    'epg_list_cache_requests_total', 'Обращения к кэшу /list по результату (hit, miss)', ('result',))
+LIST_CACHE_BYTES = metrics.registry.counter(
+    'epg_list_cache_bytes_served_total', 'Байт ответов /list, отданных из кэша')
+
+
+class ListCache:
+    """
+    Кэш сериализованных ответов /list в Redis.
+
+    Ключ строится из нормализованных параметров фильтрации и состояния таблицы пользователей, с которым
+    прочитан ответ. Пользователи только добавляются, поэтому после добавления меняется состояние и вместе с ним
+    ключ: устаревшие записи перестают использоваться сразу, а TTL лишь удаляет их из Redis. Ответ, прочитанный
+    с отстающей реплики, сохраняется под ключом её состояния и не подменяет актуальный.
+
+    Args:
+        storage (Storage): Хранилище Redis.
+        ttl (int): Время жизни записи в секундах.
+        enabled (bool): Использовать ли кэш; выключенный кэш не обращается к Redis.
+    """
+
+    def __init__(self, storage: Storage, ttl: int = 3600, enabled: bool = True):
+        self.storage = storage
+        self.ttl = ttl
+        self.enabled = enabled
+
+    @staticmethod
+    def key(params: dict, user, stamp: Sequence) -> str:
+        """
+        Формирует ключ кэша.
+
+        Ответы с фильтром расстояния (зависит от положения пользователя и не содержит его самого) и с exclude_rated
+        (зависит от его оценок) относятся к одному пользователю: в ключ добавляется его id. Остальные ответы
+        общие для всех пользователей.
+
+        Args:
+            params (dict): Параметры фильтрации.
+            user: Текущий пользователь.
+            stamp (Sequence): Состояние таблицы пользователей, а для exclude_rated — и оценок пользователя.
+
+        Returns:
+            str: Ключ записи в Redis.
+        """
+        normalized = {name: value for name, value in params.items() if value not in (None, '')}
+        if 'sort_by_registration_date' in normalized:
+            normalized['sort_by_registration_date'] = normalized['sort_by_registration_date'].lower()
+        if 'distance' in normalized or 'exclude_rated' in normalized:
+            normalized['user'] = user.id
+        normalized['stamp'] = [str(value) for value in stamp]
+        digest = hashlib.sha1(json.dumps(normalized, sort_keys=True).encode('utf-8')).hexdigest()
+        return f'list:{digest}'
+
+    async def get(self, params: dict, user, stamp: Sequence) -> tuple[Optional[bytes], Optional[str]]:
+        """
+        Ищет ответ в кэше.
+
+        Args:
+            params (dict): Параметры фильтрации.
+            user: Текущий пользователь.
+            stamp (Sequence): Состояние таблицы пользователей, а для exclude_rated — и оценок пользователя.
+
+        Returns:
+            tuple[Optional[bytes], Optional[str]]: Ответ из кэша (или None) и ключ для сохранения ответа
+                (None, если кэш выключен, Redis недоступен или вернул ошибку).
+        """
+        if not self.enabled:
+            return None, None
+        key = self.key(params, user, stamp)
+        try:
+            client = await self.storage()
+            if not client:
+                return None, None
+            body = await client.get(key)
+        except redis.RedisError as error:
+            logger.warning("Ошибка чтения кэша /list: %s", error)
+            return None, None
+        if body is None:
+            LIST_CACHE_REQUESTS.inc(result='miss')
+            return None, key
+        LIST_CACHE_REQUESTS.inc(result='hit')
+        LIST_CACHE_BYTES.inc(len(body))
+        return body, key
+
+    async def set(self, key: str, body: bytes):
+        try:
+            client = await self.storage()
+            if client:
+                await client.set(key, body, ex=self.ttl)
+        except redis.RedisError as error:
+            logger.warning("Ошибка записи в кэш /list: %s", error)
+
+
+list_cache = ListCache(
+    storage,
+    ttl=int(os.environ.get('LIST_CACHE_TTL', 3600)),
+    enabled=os.environ.get('LIST_CACHE_ENABLED', 'true').lower() != 'false',
+)
@@ -0,0 +1,101 @@
+import argparse
+import asyncio
+
+
+def import_users_command(args: argparse.Namespace):
+    """
+    Импортирует пользователей из CSV или JSONL файла.
+
+    Args:
+        args (argparse.Namespace): Аргументы командной строки.
+    """
+    from epg.importer import import_users, print_progress
+
+    stats = asyncio.run(import_users(
+        args.path,
+        fmt=args.format,
+        batch_size=args.batch_size,
+        commit_every=args.commit_every,
+        workers=args.workers,
+        default_avatar=args.default_avatar,
+        progress=print_progress,
+    ))
+    print(f"Импорт завершён за {stats.elapsed:.1f} с: добавлено {stats.inserted}, пропущено {stats.skipped}, "
+          f"дубликатов {stats.duplicates}, {stats.rate:.0f} записей/с")
+
+
+def archive_ratings_command(args: argparse.Namespace):
+    """
+    Переносит оценки старше заданного количества дней в архив.
+
+    Args:
+        args (argparse.Namespace): Аргументы командной строки.
+    """
+    import datetime
+
+    from epg.dependencies import database
+    from epg.retention import RatingArchiver
+
+    archiver = RatingArchiver(database, retention=datetime.timedelta(days=args.days),
+                              batch_size=args.batch_size, pause=args.pause_ms / 1000)
+
+    async def run():
+        try:
+            return await archiver.run(limit=args.limit)
+        finally:
+            await database.dispose()
+
+    stats = asyncio.run(run())
+    print(f"Перенесено в архив {stats.moved} оценок за {stats.elapsed:.1f} с ({stats.batches} транзакций)")
+
+
+def profile_summary_command(args: argparse.Namespace):
+    """
+    Выводит самые затратные функции по собранным профилям запросов.
+
+    Args:
+        args (argparse.Namespace): Аргументы командной строки.
+    """
+    from epg.request_profiler import summarize
+
+    print(summarize(args.directory, top=args.top, sort=args.sort, pattern=args.filter))
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog='epg', description='Служебные команды epg')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    import_parser = commands.add_parser('import-users', help='Массовый импорт пользователей из CSV или JSONL')
+    import_parser.add_argument('path', help='Путь к CSV или JSONL файлу')
+    import_parser.add_argument('--format', choices=['csv', 'jsonl'], help='Формат файла (по умолчанию по расширению)')
+    import_parser.add_argument('--batch-size', type=int, default=1000, help='Записей в одной вставке')
+    import_parser.add_argument('--commit-every', type=int, default=10, help='Пакетов в одной транзакции')
+    import_parser.add_argument('--workers', type=int, help='Количество процессов для хеширования и водяных знаков')
+    import_parser.add_argument('--default-avatar', help='Аватар для записей без поля avatar')
+    import_parser.set_defaults(handler=import_users_command)
+
+    archive_parser = commands.add_parser('archive-ratings', help='Перенос старых оценок в ratings_archive')
+    archive_parser.add_argument('--days', type=float, required=True, help='Сколько дней хранить оценки в ratings')
+    archive_parser.add_argument('--batch-size', type=int, default=1000, help='Оценок в одной транзакции')
+    archive_parser.add_argument('--pause-ms', type=float, default=50, help='Пауза между транзакциями')
+    archive_parser.add_argument('--limit', type=int, help='Максимальное количество переносимых оценок')
+    archive_parser.set_defaults(handler=archive_ratings_command)
+
+    summary_parser = commands.add_parser('profile-summary', help='Сводка по профилям запросов .pstats')
+    summary_parser.add_argument('directory', nargs='?', default='profiles', help='Каталог с профилями')
+    summary_parser.add_argument('--top', type=int, default=30, help='Количество функций в отчёте')
+    summary_parser.add_argument('--sort', default='cumulative', choices=['cumulative', 'tottime', 'ncalls'],
+                                help='Ключ сортировки')
+    summary_parser.add_argument('--filter', help='Учитывать только профили, в имени которых есть подстрока')
+    summary_parser.set_defaults(handler=profile_summary_command)
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    args.handler(args)
+
+
+if __name__ == '__main__':
+    main()
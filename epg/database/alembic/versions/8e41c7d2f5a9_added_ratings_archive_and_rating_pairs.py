@@ -0,0 +1,56 @@
+"""added ratings archive and rating pairs
+
+Revision ID: 8e41c7d2f5a9
+Revises: 3f6d2a9c8b17
+Create Date: 2026-10-19 14:03:11.207514
+
+"""
+import os
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8e41c7d2f5a9'
+down_revision: Union[str, None] = '3f6d2a9c8b17'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def partitioned() -> bool:
+    # На PostgreSQL архив секционируется по месяцам, если не задано RATINGS_ARCHIVE_PARTITIONED=false.
+    return (op.get_bind().dialect.name == 'postgresql'
+            and os.environ.get('RATINGS_ARCHIVE_PARTITIONED', 'true').lower() != 'false')
+
+
+def upgrade() -> None:
+    op.create_index(op.f('ix_ratings_date'), 'ratings', ['date'], unique=False)
+    op.create_table('rating_pairs',
+    sa.Column('rater_id', sa.Integer(), nullable=False),
+    sa.Column('rated_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['rated_id'], ['users.id'], ),
+    sa.ForeignKeyConstraint(['rater_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('rater_id', 'rated_id')
+    )
+    if partitioned():
+        op.execute(
+            'CREATE TABLE ratings_archive ('
+            'rater_id INTEGER NOT NULL, rated_id INTEGER NOT NULL, date TIMESTAMP WITHOUT TIME ZONE NOT NULL, '
+            'PRIMARY KEY (rater_id, rated_id, date)) PARTITION BY RANGE (date)'
+        )
+        op.execute('CREATE TABLE ratings_archive_default PARTITION OF ratings_archive DEFAULT')
+    else:
+        op.create_table('ratings_archive',
+        sa.Column('rater_id', sa.Integer(), nullable=False),
+        sa.Column('rated_id', sa.Integer(), nullable=False),
+        sa.Column('date', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('rater_id', 'rated_id', 'date')
+        )
+
+
+def downgrade() -> None:
+    op.drop_table('ratings_archive')
+    op.drop_table('rating_pairs')
+    op.drop_index(op.f('ix_ratings_date'), table_name='ratings')
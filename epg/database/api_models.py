@@ -1,6 +1,27 @@
+from datetime import datetime
+from typing import Literal
+
 import bcrypt
 from fastapi import Form
-from pydantic import model_validator, BaseModel, EmailStr
+from pydantic import model_validator, BaseModel, ConfigDict, EmailStr, Field
+
+from epg import metrics
+
+
+def hash_password(password: str) -> str:
+    """
+    Хеширует текстовый пароль с помощью bcrypt.
+
+    Вынесено в функцию уровня модуля, чтобы её можно было передавать в пул процессов.
+
+    Args:
+        password (str): текстовый пароль для хеширования.
+
+    Returns:
+        str: bcrypt-хеш пароля.
+    """
+    with metrics.stage('bcrypt'):
+        return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
 
 
 class User(BaseModel):
@@ -43,7 +64,7 @@ class User(BaseModel):
         Args:
             password (str): текстовый пароль для хеширования.
         """
-        self.password = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+        self.password = hash_password(password)
 
     @staticmethod
     def verify_password(password: str, hashed_password: str) -> bool:
@@ -58,7 +79,8 @@ class User(BaseModel):
             bool: True, если пароль совпадает, False в противном случае.
         """
 
-        return bcrypt.checkpw(password.encode('utf-8'), hashed_password.encode('utf-8'))
+        with metrics.stage('bcrypt'):
+            return bcrypt.checkpw(password.encode('utf-8'), hashed_password.encode('utf-8'))
 
     @classmethod
     def as_form(
@@ -95,3 +117,90 @@ class User(BaseModel):
             longitude=longitude,
             latitude=latitude
         )
+
+
+class UserOut(BaseModel):
+    """
+    Пользователь в ответах API. Не содержит хеш пароля.
+
+    Attributes:
+        id (int): Идентификатор пользователя.
+        avatar (str): Путь к аватару с водяным знаком.
+        gender (str): Пол пользователя.
+        first_name (str): Имя пользователя.
+        last_name (str): Фамилия пользователя.
+        email (str): Адрес электронной почты пользователя.
+        date (datetime): Дата регистрации.
+        latitude (float): Координата широты местоположения пользователя.
+        longitude (float): Координата долготы местоположения пользователя.
+    """
+
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    avatar: str
+    gender: str
+    first_name: str
+    last_name: str
+    email: str
+    date: datetime
+    latitude: float
+    longitude: float
+
+
+class UserList(BaseModel):
+    """
+    Ответ /list.
+
+    Attributes:
+        users (list[UserOut]): Пользователи, соответствующие фильтрам.
+    """
+
+    users: list[UserOut]
+
+
+class Message(BaseModel):
+    """
+    Ответ с текстовым сообщением.
+
+    Attributes:
+        message (str): Сообщение.
+    """
+
+    message: str
+
+
+class MatchBatch(BaseModel):
+    """
+    Запрос пакетной оценки.
+
+    Attributes:
+        ids (list[int]): Идентификаторы оцениваемых пользователей в порядке оценки.
+    """
+
+    ids: list[int] = Field(min_length=1, max_length=100)
+
+
+class MatchResult(BaseModel):
+    """
+    Результат оценки одного пользователя из пакета.
+
+    Attributes:
+        id (int): Идентификатор оцениваемого пользователя.
+        status (str): rated — оценка добавлена, mutual — взаимная симпатия, already_rated — уже оценён,
+            not_found — пользователь не найден, self — попытка оценить себя, limit_exceeded — превышен дневной лимит.
+    """
+
+    id: int
+    status: Literal['rated', 'mutual', 'already_rated', 'not_found', 'self', 'limit_exceeded']
+
+
+class MatchBatchResult(BaseModel):
+    """
+    Ответ пакетной оценки.
+
+    Attributes:
+        results (list[MatchResult]): Результаты в порядке идентификаторов запроса.
+    """
+
+    results: list[MatchResult]
@@ -20,7 +20,7 @@ class User(Base):
     last_name: Mapped[str] = mapped_column(nullable=False)
     email: Mapped[str] = mapped_column(unique=True, nullable=False)
     password: Mapped[str] = mapped_column(nullable=False)
-    date: Mapped[datetime] = mapped_column(nullable=False)
+    date: Mapped[datetime] = mapped_column(nullable=False, index=True)
     latitude: Mapped[float] = mapped_column()
     longitude: Mapped[float] = mapped_column()
 
@@ -30,4 +30,19 @@ class Rating(Base):
 
     rater_id: Mapped[int] = mapped_column(ForeignKey("users.id"), primary_key=True)
     rated_id: Mapped[int] = mapped_column(ForeignKey("users.id"), primary_key=True)
-    date: Mapped[datetime] = mapped_column(nullable=False)
+    date: Mapped[datetime] = mapped_column(nullable=False, index=True)
+
+
+class RatingArchive(Base):
+    __tablename__ = "ratings_archive"
+
+    rater_id: Mapped[int] = mapped_column(primary_key=True)
+    rated_id: Mapped[int] = mapped_column(primary_key=True)
+    date: Mapped[datetime] = mapped_column(primary_key=True)
+
+
+class RatingPair(Base):
+    __tablename__ = "rating_pairs"
+
+    rater_id: Mapped[int] = mapped_column(ForeignKey("users.id"), primary_key=True)
+    rated_id: Mapped[int] = mapped_column(ForeignKey("users.id"), primary_key=True)
@@ -1,43 +1,208 @@
+import asyncio
+import itertools
+import logging
 import os
-from contextlib import asynccontextmanager
+import time
+from collections import OrderedDict
+from contextlib import AsyncExitStack, asynccontextmanager
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
+from typing import Iterable, Optional
 
 import aiosmtplib
 import redis.asyncio as redis
-from alembic.config import Config
 from dotenv import load_dotenv
-from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from fastapi import Depends, Request
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine, async_sessionmaker
+
+from epg import metrics, sql_profiler
+from epg.database import storage_models as sm
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+
+DB_READS = metrics.registry.counter(
+    'epg_db_read_sessions_total', 'Сеансы только для чтения по базе (primary, replica)', ('target',))
+
+
+def client_keys(request: Request) -> list[str]:
+    """
+    Возвращает идентификаторы клиента: IP-адрес и, если передан параметр email, почту.
+
+    IP-адрес берётся из request.client. За обратным прокси это адрес прокси, если uvicorn не доверяет его
+    заголовкам X-Forwarded-For: адрес прокси нужно указать в FORWARDED_ALLOW_IPS (или --forwarded-allow-ips).
+    """
+    keys = [f'ip:{request.client.host if request.client else "unknown"}']
+    if email := request.query_params.get('email'):
+        keys.append(f'email:{email.lower()}')
+    return keys
+
 
 class Database:
     """
     Класс для управления подключением к базе данных и предоставления сеансов для асинхронных операций с базой данных.
 
+    Движки создаются при первом обращении или при запуске приложения в lifespan, а не при импорте.
+    Чтение можно направлять на реплики зависимостью reader: реплики выбираются по кругу. После записи
+    в основную базу клиент (по почте) на read_your_writes секунд закрепляется за основной базой, чтобы видеть
+    свои изменения до того, как они дойдут до реплик. Закрепление хранится в Redis и поэтому действует во всех
+    экземплярах приложения; без Redis — в памяти процесса.
+
     Args:
        link (str): URL-адрес подключения к базе данных.
+       replica_links (Iterable[str]): URL-адреса реплик только для чтения.
+       read_your_writes (float): Время закрепления клиента за основной базой после записи в секундах.
+       storage (Optional[Storage]): Хранилище Redis для закреплений.
 
     Attributes:
        engine: асинхронный движок для операций с базой данных.
+       reader: зависимость FastAPI, предоставляющая сеанс только для чтения.
        _async_session: экземпляр sessionmaker для создания асинхронных сеансов.
     """
 
-    def __init__(self, link):
-        self.engine = create_async_engine(link)
-        self._async_session = async_sessionmaker(self.engine, expire_on_commit=False)
+    def __init__(self, link, replica_links: Iterable[str] = (), read_your_writes: float = 5.0,
+                 storage: Optional['Storage'] = None):
+        self.link = link
+        self.replica_links = [replica for replica in replica_links if replica]
+        self.read_your_writes = read_your_writes
+        self.storage = storage
+        self._engine = None
+        self._async_session = None
+        self._replicas: list[AsyncEngine] = []
+        self._replica_sessions: list[async_sessionmaker] = []
+        self._next_replica = itertools.count()
+        self._pinned: OrderedDict[str, float] = OrderedDict()
+        self.reader = self._make_reader()
+
+    @staticmethod
+    def _create_engine(link) -> AsyncEngine:
+        engine = create_async_engine(link)
+        sql_profiler.from_env().attach(engine.sync_engine)
+        return engine
+
+    def _connect(self):
+        self._engine = self._create_engine(self.link)
+        self._async_session = async_sessionmaker(self._engine, expire_on_commit=False)
+        self._replicas = [self._create_engine(link) for link in self.replica_links]
+        self._replica_sessions = [async_sessionmaker(engine, expire_on_commit=False) for engine in self._replicas]
+
+    @property
+    def engine(self) -> AsyncEngine:
+        if self._engine is None:
+            self._connect()
+        return self._engine
+
+    async def pin(self, email: str):
+        """
+        Закрепляет клиента за основной базой на read_your_writes секунд, если заданы реплики.
+
+        Ошибка Redis только логируется: клиент остаётся закреплённым в памяти процесса.
+
+        Args:
+            email (str): Почта клиента.
+        """
+        if not self.replica_links:
+            return
+        key = f'pin:{email.lower()}'
+        now = time.monotonic()
+        self._pinned.pop(key, None)
+        self._pinned[key] = now + self.read_your_writes
+        while self._pinned and next(iter(self._pinned.values())) <= now:
+            self._pinned.popitem(last=False)
+        if self.storage is None or self.read_your_writes <= 0:
+            return
+        try:
+            client = await self.storage()
+            if client:
+                await client.set(key, 1, px=int(self.read_your_writes * 1000))
+        except redis.RedisError as error:
+            logger.warning("Не удалось закрепить клиента за основной базой в Redis: %s", error)
+
+    async def pinned(self, email: str) -> bool:
+        """
+        Проверяет, закреплён ли клиент за основной базой в этом или другом экземпляре приложения.
+
+        Args:
+            email (str): Почта клиента.
+        """
+        key = f'pin:{email.lower()}'
+        if self._pinned.get(key, 0) > time.monotonic():
+            return True
+        if self.storage is None:
+            return False
+        try:
+            client = await self.storage()
+            return bool(client and await client.exists(key))
+        except redis.RedisError as error:
+            logger.warning("Не удалось проверить закрепление клиента в Redis: %s", error)
+            return False
+
+    async def warm_up(self, connections: int = 1):
+        """
+        Открывает соединения пула и выполняет первые запросы, чтобы их стоимость не ложилась на первые
+        запросы клиентов.
+
+        Args:
+            connections (int): Количество одновременно открываемых соединений с основной базой и каждой репликой.
+        """
+        async def open_connection(engine: AsyncEngine):
+            async with engine.connect() as conn:
+                await conn.execute(text('SELECT 1'))
+
+        engines = [self.engine, *self._replicas]
+        await asyncio.gather(*(open_connection(engine) for engine in engines for _ in range(connections)))
+        for sessionmaker in (self._async_session, *self._replica_sessions):
+            async with sessionmaker() as session:
+                await session.execute(select(sm.User).limit(1))
+
+    async def dispose(self):
+        if self._engine is not None:
+            for engine in (self._engine, *self._replicas):
+                await engine.dispose()
+            self._engine = None
+            self._async_session = None
+            self._replicas = []
+            self._replica_sessions = []
 
     async def __call__(self):
         """
-        Предоставляет сеанс для взаимодействия с базой данных.
+        Предоставляет сеанс для взаимодействия с основной базой данных.
 
         Yields:
           AsyncSession: асинхронный сеанс для транзакций базы данных.
         """
+        if self._async_session is None:
+            self._connect()
         async with self._async_session() as session:
+            session.info['database'] = self
             yield session
 
+    def _make_reader(self):
+        async def reader(request: Request, primary: AsyncSession = Depends(self)):
+            """
+            Предоставляет сеанс только для чтения: на реплике, если они заданы и клиент не закреплён
+            за основной базой, иначе — сеанс основной базы текущего запроса.
+
+            Yields:
+              AsyncSession: асинхронный сеанс для чтения.
+            """
+            email = request.query_params.get('email')
+            if not self.replica_links or (email and await self.pinned(email)):
+                DB_READS.inc(target='primary')
+                yield primary
+                return
+            if self._async_session is None:
+                self._connect()
+            sessionmaker = self._replica_sessions[next(self._next_replica) % len(self._replica_sessions)]
+            async with sessionmaker() as session:
+                DB_READS.inc(target='replica')
+                yield session
+
+        return reader
+
 
 class EmailSender:
     """
@@ -48,12 +213,14 @@ class EmailSender:
        password (str): Пароль для учетной записи электронной почты отправителя.
        smtp_server (str): Адрес SMTP-сервера.
        port (int): Порт SMTP-сервера.
+       use_tls (bool): Использовать ли TLS при подключении к SMTP-серверу.
     """
     def __init__(self):
         self.sender = os.environ.get('SMTP_EMAIL_FROM')
         self.password = os.environ.get('SMTP_EMAIL_FROM_PASSWORD')
-        self.smtp_server = os.environ.get('SMTP_SERVER')
-        self.port = os.environ.get('PORT')
+        self.smtp_server = os.environ.get('SMTP_SERVER', 'smtp.mail.ru')
+        self.port = int(os.environ.get('PORT', 465))
+        self.use_tls = os.environ.get('SMTP_USE_TLS', 'true').lower() != 'false'
 
     async def __call__(self, recipient_email: str, message: str):
         """
@@ -64,24 +231,38 @@ class EmailSender:
             message (str): Содержимое сообщения, которое будет отправлено в электронном письме.
         """
         try:
-            msg = MIMEMultipart()
-            msg["From"] = self.sender
-            msg["To"] = recipient_email
-            msg["Subject"] = "Уведомление о взаимной симпатии"
-            msg.attach(MIMEText(message, "plain"))
-            async with aiosmtplib.SMTP(hostname="smtp.mail.ru", port=465, use_tls=True) as server:
-                await server.login(self.sender, self.password)
-
-                await server.send_message(msg)
+            with metrics.stage('smtp'):
+                msg = MIMEMultipart()
+                msg["From"] = self.sender
+                msg["To"] = recipient_email
+                msg["Subject"] = "Уведомление о взаимной симпатии"
+                msg.attach(MIMEText(message, "plain"))
+                async with aiosmtplib.SMTP(hostname=self.smtp_server, port=self.port,
+                                           use_tls=self.use_tls) as server:
+                    await server.login(self.sender, self.password)
+
+                    await server.send_message(msg)
         except Exception as e:
             print(f"Произошла ошибка при отправке почты: {e}")
 
 
+class _InstrumentedRedis(redis.Redis):
+    """
+    Клиент Redis, относящий время каждой команды к этапу redis текущего запроса.
+    """
+
+    async def execute_command(self, *args, **options):
+        with metrics.stage('redis'):
+            return await super().execute_command(*args, **options)
+
+
 # Класс хранилища redis
 class Storage:
     """
     Класс для управления подключением к Redis.
 
+    Клиент создаётся при первом обращении, а не при импорте.
+
     Args:
        url (str): URL-адрес подключения Redis.
 
@@ -89,7 +270,23 @@ class Storage:
        client: Клиент Redis для взаимодействия с базой данных Redis.
     """
     def __init__(self, url):
-        self.client = redis.from_url(url)
+        self.url = url
+        self._client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = _InstrumentedRedis.from_url(self.url)
+        return self._client
+
+    @client.setter
+    def client(self, client):
+        self._client = client
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
 
     async def __call__(self):
         """
@@ -107,11 +304,39 @@ class Storage:
 
 storage = Storage(os.environ.get('REDIS_URL'))
 
-database = Database(os.environ.get('DATABASE_URL'))
+database = Database(
+    os.environ.get('DATABASE_URL'),
+    replica_links=os.environ.get('DATABASE_REPLICA_URLS', '').split(','),
+    read_your_writes=float(os.environ.get('DATABASE_READ_YOUR_WRITES_SECONDS', 5)),
+    storage=storage,
+)
+
+
+async def pin_after_write(session: AsyncSession, email: str):
+    """
+    Закрепляет клиента за основной базой, предоставившей сеанс session, после записи в неё.
+
+    Args:
+        session (AsyncSession): Сеанс основной базы, в котором выполнена запись.
+        email (str): Почта клиента.
+    """
+    if owner := session.info.get('database'):
+        await owner.pin(email)
 email_sender = EmailSender()
-alembic_cfg = Config("./alembic.ini")
 
 
 @asynccontextmanager
-async def lifespan(_):
-    yield
+async def resources():
+    """
+    Подключается к базе данных и Redis и прогревает их, а при выходе закрывает соединения.
+
+    Количество заранее открываемых соединений с базой данных задаётся WARMUP_DB_CONNECTIONS (по умолчанию 1).
+    Недоступность Redis не мешает запуску: приложение работает без кэша.
+    """
+    async with AsyncExitStack() as stack:
+        stack.push_async_callback(database.dispose)
+        await database.warm_up(int(os.environ.get('WARMUP_DB_CONNECTIONS', 1)))
+        stack.push_async_callback(storage.close)
+        if not await storage():
+            logger.warning("Redis недоступен, приложение запущено без кэша")
+        yield
@@ -1,8 +1,41 @@
+import logging
+import time
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
+from fastapi.concurrency import run_in_threadpool
+
+from epg import batching, dependencies, request_profiler, retention, sql_profiler
+from epg.endpoints import clients, methods, service
+from epg.endpoints.middleware import MetricsMiddleware, ProfilingMiddleware, SQLProfilingMiddleware
+from epg.endpoints.responses import ORJSONResponse
+
+logger = logging.getLogger(__name__)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Подключается к базе данных и Redis, прогревает их и ресурсы обработчиков, запускает групповую
+    фиксацию оценок и перенос старых оценок в архив, если они включены. /ready отвечает 200 только
+    между завершением прогрева и остановкой.
+    """
+    app.state.ready = False
+    started = time.perf_counter()
+    async with dependencies.resources(), batching.rating_writer.running(), retention.running():
+        await run_in_threadpool(clients.warm_up)
+        app.state.ready = True
+        logger.info("Прогрев завершён за %.0f мс", (time.perf_counter() - started) * 1000)
+        yield
+        app.state.ready = False
 
-from epg import dependencies
-from epg.endpoints import clients, methods
 
-app = FastAPI(root_path="/api", lifespan=dependencies.lifespan)
+app = FastAPI(root_path="/api", lifespan=lifespan, default_response_class=ORJSONResponse)
+app.add_middleware(MetricsMiddleware)
+if sql_profiler.enabled():
+    app.add_middleware(SQLProfilingMiddleware)
+if request_profiler.enabled():
+    app.add_middleware(ProfilingMiddleware)
+app.include_router(service.app)
 app.include_router(clients.app, prefix='/clients')
 app.include_router(methods.app, prefix='/list')
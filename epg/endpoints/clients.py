@@ -1,16 +1,23 @@
+import asyncio
 import datetime
+import functools
 import hashlib
 import os.path
 from io import BytesIO
 
 from PIL import Image
+from epg import metrics
+from epg.batching import rating_writer
 from epg.database import api_models as am
 from epg.database import storage_models as sm
-from epg.dependencies import database, email_sender
+from epg.dependencies import database, email_sender, pin_after_write
+from epg.rate_limit import rate_limit
+from epg.retention import insert_ignore, rating_exists
 from fastapi import APIRouter, Depends, HTTPException, Query, UploadFile
 from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordBearer
-from pydantic import EmailStr
+from pydantic import EmailStr, TypeAdapter
+from sqlalchemy import exists, false, func, null, or_, update
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
@@ -20,11 +27,50 @@ app = APIRouter()
 
 resource_path = os.path.join(os.path.dirname(__file__), '../../resources')
 watermark_path = os.path.join(resource_path, 'watermark.png')
-images_path = os.path.join(resource_path, 'images')
-os.makedirs(images_path, exist_ok=True)
-RATING_LIMIT_PER_DAY = int(os.environ.get('RATING_LIMIT_PER_DAY'))
+images_path = os.environ.get('IMAGES_DIR') or os.path.join(resource_path, 'images')
 
 
+@functools.cache
+def rating_limit_per_day() -> int:
+    """
+    Возвращает дневной лимит оценок из RATING_LIMIT_PER_DAY. Читается при первом обращении, а не при импорте.
+    """
+    return int(os.environ.get('RATING_LIMIT_PER_DAY'))
+
+
+@functools.cache
+def _ensure_dir(path: str) -> str:
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+@functools.cache
+def _watermark() -> Image.Image:
+    with Image.open(watermark_path) as watermark:
+        return watermark.convert("RGBA")
+
+
+@functools.lru_cache(maxsize=64)
+def _scaled_watermark(size: tuple[int, int]) -> Image.Image:
+    watermark = _watermark().resize(size, Image.LANCZOS)
+    alpha = watermark.split()[3]
+    alpha = alpha.point(lambda p: p * 0.5)
+    watermark.putalpha(alpha)
+    return watermark
+
+
+def warm_up():
+    """
+    Создаёт каталог изображений, загружает водяной знак, читает настройки и проверяет пробный адрес
+    почты (email_validator лениво загружает таблицы idna), чтобы первый запрос не тратил на это время.
+    """
+    _ensure_dir(images_path)
+    _watermark()
+    rating_limit_per_day()
+    TypeAdapter(EmailStr).validate_python('warm-up@example.com')
+
+
+@metrics.stage('watermark')
 def add_watermark(avatar_data: bytes) -> str:
     """
     Добавляет водяной знак к изображению аватара и сохраняет его.
@@ -42,27 +88,24 @@ def add_watermark(avatar_data: bytes) -> str:
     image_hash = hashlib.md5(image_data.getvalue()).hexdigest()
     hash_part = image_hash[:8]
 
-    with Image.open(watermark_path).convert("RGBA") as watermark:
-        with Image.open(image_data).convert("RGBA") as base_image:
-            base_width, base_height = base_image.size
-            watermark_size = (base_width // 6, base_height // 6)
-            watermark = watermark.resize(watermark_size, Image.LANCZOS)
-
-            alpha = watermark.split()[3]
-            alpha = alpha.point(lambda p: p * 0.5)
-            watermark.putalpha(alpha)
-
-            position = (base_width - watermark_size[0], base_height - watermark_size[1])
-            base_image.paste(watermark, position, watermark)
-            output = BytesIO()
-            base_image.save(output, format="PNG")
-            output.seek(0)
-    with open(os.path.join(images_path, f'{hash_part}.png'), "wb") as out_file:
+    with Image.open(image_data).convert("RGBA") as base_image:
+        base_width, base_height = base_image.size
+        watermark_size = (base_width // 6, base_height // 6)
+        # Водяной знак загружается и масштабируется один раз для каждого размера.
+        watermark = _scaled_watermark(watermark_size)
+
+        position = (base_width - watermark_size[0], base_height - watermark_size[1])
+        base_image.paste(watermark, position, watermark)
+        output = BytesIO()
+        base_image.save(output, format="PNG")
+        output.seek(0)
+    with open(os.path.join(_ensure_dir(images_path), f'{hash_part}.png'), "wb") as out_file:
         out_file.write(output.getbuffer())
     return hash_part
 
 
-@app.post("/create")
+# Регистрации ограничиваются правилом RATE_LIMIT_CREATE.
+@app.post("/create", dependencies=rate_limit("create"))
 async def create(avatar: UploadFile,
                  user: am.User = Depends(am.User.as_form),
                  db: AsyncSession = Depends(database)):
@@ -99,25 +142,75 @@ async def create(avatar: UploadFile,
         )
         db.add(user_instance)
         await db.commit()
+        await pin_after_write(db, user.email)
         return "Ok"
     except IntegrityError:
         raise HTTPException(status_code=422, detail="Электронная почта уже используется")
 
 
-@app.post("/{id}/match")
+async def notify_mutual(first, second):
+    """
+    Отправляет обоим участникам взаимной симпатии письма с почтой друг друга.
+
+    Args:
+        first (sm.User): Первый участник.
+        second (sm.User): Второй участник.
+    """
+    await asyncio.gather(
+        email_sender(second.email, f"Вам понравился {first.first_name}! Почта участника: {first.email}"),
+        email_sender(first.email, f"Вам понравился {second.first_name}! Почта участника: {second.email}"),
+    )
+
+
+async def find_users(db: AsyncSession, email: str, id: int) -> tuple:
+    """
+    Загружает текущего пользователя по почте и оцениваемого по идентификатору.
+
+    Returns:
+        tuple: Текущий и оцениваемый пользователи (None, если не найден).
+    """
+    current_user = (await db.execute(select(sm.User).where(sm.User.email == email))).scalar_one_or_none()
+    receiver = (await db.execute(select(sm.User).where(sm.User.id == id))).scalar_one_or_none()
+    return current_user, receiver
+
+
+async def lock_rater(db: AsyncSession, user_id: int):
+    """
+    Блокирует оценки пользователя до конца транзакции: одновременные запросы того же пользователя ждут её
+    фиксации и считают оценки за сегодня уже с учётом этой транзакции.
+
+    Args:
+        db (AsyncSession): Сеанс основной базы данных.
+        user_id (int): Идентификатор оценивающего пользователя.
+    """
+    if db.bind.dialect.name == 'sqlite':
+        # SQLite не поддерживает SELECT ... FOR UPDATE. Изменяющий запрос берёт блокировку записи в базу
+        # до фиксации, даже если не затрагивает ни одной строки.
+        await db.execute(update(sm.User).where(false()).values(id=sm.User.id))
+    else:
+        await db.execute(select(sm.User.id).where(sm.User.id == user_id).with_for_update())
+
+
+@app.post("/{id}/match", response_model=am.Message)
 async def match(
         id: int,
         email: EmailStr = Query(description="Почта текущего пользователя"),
-        db: AsyncSession = Depends(database)
+        db: AsyncSession = Depends(database),
+        reader: AsyncSession = Depends(database.reader)
 ):
     """
     Добавляет оценку текущего пользователя другому пользователю и проверяет наличие взаимного интереса.
-    Отправляет уведомление по электронной почте в случае взаимного соответствия.
+    Отправляет уведомление по электронной почте в случае взаимного соответствия. Оценки пользователя блокируются
+    так же, как в пакетной оценке, поэтому одновременные запросы не превышают дневной лимит. Если включена
+    групповая фиксация (RATING_GROUP_COMMIT), оценка записывается вместе с оценками одновременных запросов;
+    блокировка при этом не берётся, и одновременные запросы одного пользователя могут превысить лимит на
+    количество ещё не записанных оценок.
 
     Args:
         id (int): Идентификатор оцениваемого пользователя.
         email (EmailStr): Адрес электронной почты текущего пользователя.
         db (AsyncSession): Сеанс базы данных.
+        reader (AsyncSession): Сеанс только для чтения для поиска пользователей.
 
     Returns:
         dict: Сообщение, указывающее на успех или взаимный интерес.
@@ -127,48 +220,152 @@ async def match(
     """
 
     try:
-        current_user = (await db.execute(select(sm.User).where(sm.User.email == email))).scalar_one_or_none()
-        receiver = (await db.execute(select(sm.User).where(sm.User.id == id))).scalar_one_or_none()
+        # Пользователи ищутся на реплике; только что зарегистрированных, которых на ней ещё нет, —
+        # в основной базе. Лимит и взаимность проверяются в основной базе.
+        current_user, receiver = await find_users(reader, email, id)
+        if reader is not db and (not current_user or not receiver):
+            current_user, receiver = await find_users(db, email, id)
 
         if not current_user or not receiver:
             raise HTTPException(status_code=404, detail="Пользователь не найден")
         if current_user.id == id:
             raise HTTPException(status_code=400, detail="Вы не можете оценить себя")
+        if not rating_writer.started:
+            # Задача групповой фиксации пишет своим соединением: блокировка запроса задержала бы её.
+            await lock_rater(db, current_user.id)
         today = datetime.datetime.now().date()
-        ratings_today = await db.execute(
-            select(sm.Rating)
+        # Количество оценок за сегодня и оценка, уже перенесённая в архив, проверяются одним запросом.
+        ratings_count, archived = (await db.execute(select(
+            select(func.count())
             .where(sm.Rating.rater_id == current_user.id,
                    sm.Rating.date >= today,
                    sm.Rating.date < today + datetime.timedelta(days=1)
-                   )
-        )
-        ratings_count = len(ratings_today.scalars().all())
+                   ).scalar_subquery(),
+            exists().where(sm.RatingPair.rater_id == current_user.id, sm.RatingPair.rated_id == id),
+        ))).one()
 
-        if ratings_count >= RATING_LIMIT_PER_DAY:
+        if ratings_count >= rating_limit_per_day():
             raise HTTPException(status_code=429, detail="Лимит оценок в день превышен")
-
-        rate = sm.Rating(rater_id=current_user.id, rated_id=id, date=datetime.datetime.now())
-        db.add(rate)
-        await db.commit()
-
-        mutual = (await db.execute(select(sm.Rating).where(
-            sm.Rating.rater_id == id,
-            sm.Rating.rated_id == current_user.id
-        ))).scalar_one_or_none()
+        if archived:
+            raise HTTPException(status_code=400, detail="Вы уже оценили этого участника")
+
+        if rating_writer.started:
+            # Завершаем транзакцию чтения, чтобы соединение запроса не удерживало блокировку SQLite,
+            # пока задача записи фиксирует пакет.
+            await db.commit()
+            await rating_writer.add(current_user.id, id, datetime.datetime.now())
+        else:
+            rate = sm.Rating(rater_id=current_user.id, rated_id=id, date=datetime.datetime.now())
+            db.add(rate)
+            await db.commit()
+        await pin_after_write(db, email)
+
+        mutual = (await db.execute(select(rating_exists(id, current_user.id)))).scalar()
 
         if mutual:
-            matched_user_query = await db.execute(select(sm.User).where(sm.User.id == id))
-            matched_user = matched_user_query.scalar_one_or_none()
-            if matched_user:
-                await email_sender(
-                    matched_user.email,
-                    f"Вам понравился {current_user.first_name}! Почта участника: {current_user.email}"
-                )
-                await email_sender(
-                    current_user.email,
-                    f"Вам понравился {matched_user.first_name}! Почта участника: {matched_user.email}"
-                )
+            await notify_mutual(current_user, receiver)
             return {"message": "Взаимная симпатия! Проверьте почту"}
     except IntegrityError:
         raise HTTPException(status_code=400, detail="Вы уже оценили этого участника")
     return {"message": "Оценка добавлена"}
+
+
+@app.post("/match", response_model=am.MatchBatchResult)
+async def match_many(
+        batch: am.MatchBatch,
+        email: EmailStr = Query(description="Почта текущего пользователя"),
+        db: AsyncSession = Depends(database),
+        reader: AsyncSession = Depends(database.reader)
+):
+    """
+    Оценивает несколько пользователей одним запросом.
+
+    Дневной лимит проверяется один раз для всего пакета: пользователи оцениваются в порядке ids, пока лимит
+    не исчерпан. Строка оценивающего блокируется до фиксации, поэтому одновременные пакеты одного пользователя
+    не превышают лимит. Оценки добавляются одной многострочной вставкой; оценки, добавленные параллельным
+    запросом, пропускаются и получают статус already_rated. Взаимные симпатии находятся одним запросом,
+    а письма о них отправляются одновременно. Повторяющиеся идентификаторы учитываются один раз.
+
+    Args:
+        batch (am.MatchBatch): Идентификаторы оцениваемых пользователей.
+        email (EmailStr): Адрес электронной почты текущего пользователя.
+        db (AsyncSession): Сеанс базы данных.
+        reader (AsyncSession): Сеанс только для чтения для поиска пользователей.
+
+    Returns:
+        am.MatchBatchResult: Результат оценки каждого пользователя.
+
+    Raises:
+        HTTPException: Если текущий пользователь не найден.
+    """
+    ids = list(dict.fromkeys(batch.ids))
+    query = select(sm.User).where(or_(sm.User.email == email, sm.User.id.in_(ids)))
+    users = (await reader.execute(query)).scalars().all()
+    current_user = next((user for user in users if user.email == email), None)
+    # Недостающих на реплике пользователей ищем в основной базе.
+    if reader is not db and (not current_user or {user.id for user in users} != {*ids, current_user.id}):
+        users = (await db.execute(query)).scalars().all()
+        current_user = next((user for user in users if user.email == email), None)
+    if not current_user:
+        raise HTTPException(status_code=404, detail="Пользователь не найден")
+    targets = {user.id: user for user in users}
+
+    await lock_rater(db, current_user.id)
+
+    # Оценки за сегодня и уже оценённые из пакета загружаются одним запросом.
+    today = datetime.datetime.combine(datetime.date.today(), datetime.time())
+    tomorrow = today + datetime.timedelta(days=1)
+    # Перенесённые в архив оценки (rating_pairs) попадают в выборку с пустой датой.
+    ratings = (await db.execute(
+        select(sm.Rating.rated_id, sm.Rating.date)
+        .where(sm.Rating.rater_id == current_user.id,
+               or_(sm.Rating.rated_id.in_(ids), (sm.Rating.date >= today) & (sm.Rating.date < tomorrow)))
+        .union_all(select(sm.RatingPair.rated_id, null())
+                   .where(sm.RatingPair.rater_id == current_user.id, sm.RatingPair.rated_id.in_(ids)))
+    )).all()
+    already_rated = {rated_id for rated_id, _ in ratings}
+    remaining = rating_limit_per_day() - sum(date is not None and today <= date < tomorrow for _, date in ratings)
+
+    statuses, accepted = {}, []
+    for target_id in ids:
+        if target_id == current_user.id:
+            statuses[target_id] = 'self'
+        elif target_id not in targets:
+            statuses[target_id] = 'not_found'
+        elif target_id in already_rated:
+            statuses[target_id] = 'already_rated'
+        elif len(accepted) >= remaining:
+            statuses[target_id] = 'limit_exceeded'
+        else:
+            statuses[target_id] = 'rated'
+            accepted.append(target_id)
+
+    mutual = []
+    if accepted:
+        now = datetime.datetime.now()
+        # Оценку мог добавить параллельный одиночный запрос: такие строки пропускаются.
+        inserted = set((await db.execute(
+            insert_ignore(db.bind.dialect.name, sm.Rating)
+            .values([{'rater_id': current_user.id, 'rated_id': target_id, 'date': now} for target_id in accepted])
+            .returning(sm.Rating.rated_id)
+        )).scalars().all())
+        for target_id in accepted:
+            if target_id not in inserted:
+                statuses[target_id] = 'already_rated'
+        if inserted:
+            mutual = (await db.execute(
+                select(sm.Rating.rater_id)
+                .where(sm.Rating.rater_id.in_(inserted), sm.Rating.rated_id == current_user.id)
+                .union(select(sm.RatingPair.rater_id)
+                       .where(sm.RatingPair.rater_id.in_(inserted), sm.RatingPair.rated_id == current_user.id))
+            )).scalars().all()
+        await db.commit()
+        await pin_after_write(db, email)
+        for target_id in mutual:
+            statuses[target_id] = 'mutual'
+        await asyncio.gather(*(notify_mutual(current_user, targets[target_id]) for target_id in mutual))
+    else:
+        # Снимаем блокировку строки оценивающего, не дожидаясь закрытия сеанса.
+        await db.rollback()
+
+    return {"results": [{"id": target_id, "status": statuses[target_id]} for target_id in ids]}
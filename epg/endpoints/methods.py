@@ -1,19 +1,78 @@
+import hashlib
+import json
 from http.client import HTTPException
 from typing import Optional
 
+import orjson
+from epg.cache import list_cache
+from epg.database import api_models as am
 from epg.database import storage_models as sm
 from epg.dependencies import database
+from epg.rate_limit import rate_limit
+from epg.retention import rating_exists
 from epg.utils import calculate_distance
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response
 from pydantic import EmailStr
-from sqlalchemy import asc, desc
+from sqlalchemy import asc, desc, func, true
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
+from sqlalchemy.orm import aliased
 
 app = APIRouter()
 
+USER_FIELDS = tuple(am.UserOut.model_fields)
+# Столбцы ответа /list. Список читается кортежами Row, без создания сущностей sm.User, их валидации
+# и регистрации в identity map сеанса.
+USER_COLUMNS = tuple(getattr(sm.User, field) for field in USER_FIELDS)
 
-@app.get("")
+
+def serialize_users(rows) -> bytes:
+    """
+    Сериализует ответ /list напрямую через orjson, без промежуточной валидации моделей.
+
+    Args:
+        rows: Строки со столбцами USER_COLUMNS.
+
+    Returns:
+        bytes: JSON вида {"users": [...]}.
+    """
+    return orjson.dumps({"users": [dict(zip(USER_FIELDS, row)) for row in rows]})
+
+
+def list_etag(email: str, params: dict, *stamp) -> str:
+    """
+    Вычисляет ETag ответа /list.
+
+    Args:
+        email (str): Почта текущего пользователя: ответ с фильтром расстояния зависит от его положения.
+        params (dict): Параметры фильтрации.
+        *stamp: Состояние таблицы пользователей (максимальный id и последняя дата регистрации) и, при
+            exclude_rated, оценок текущего пользователя.
+
+    Returns:
+        str: Слабый ETag.
+    """
+    validator = json.dumps([email, params, *stamp], sort_keys=True, default=str)
+    return f'W/"{hashlib.sha1(validator.encode("utf-8")).hexdigest()}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    Проверяет заголовок If-None-Match по правилам слабого сравнения.
+    """
+    if not if_none_match:
+        return False
+    tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return "*" in tags or etag.removeprefix("W/") in tags
+
+
+def has_distance(request: Request) -> bool:
+    return bool(request.query_params.get("distance"))
+
+
+# Запросы с фильтром расстояния ограничиваются правилом RATE_LIMIT_LIST_DISTANCE.
+@app.get("", response_model=am.UserList, responses={304: {"description": "Список не изменился"}},
+         dependencies=rate_limit("list_distance", when=has_distance))
 async def get_user_list(
         email: EmailStr = Query(description="Почта текущего пользователя"),
         gender: Optional[str] = Query(None, description="Фильтр по полу"),
@@ -22,7 +81,9 @@ async def get_user_list(
         sort_by_registration_date: Optional[str] = Query(None,
                                                          description="Сортировать по дате регистрации (asc или desc)"),
         distance: Optional[float] = Query(None, description="Расстояние в км"),
-        db: AsyncSession = Depends(database)
+        exclude_rated: bool = Query(False, description="Исключить пользователей, уже оценённых текущим"),
+        if_none_match: Optional[str] = Header(None),
+        db: AsyncSession = Depends(database.reader)
 ):
     """
     Получает отфильтрованный список пользователей на основе указанных критериев.
@@ -36,21 +97,50 @@ async def get_user_list(
             либо «asc», либо «desc».
         distance (Optional[float]): необязательный фильтр расстояния в километрах для извлечения пользователей в
             определенном радиусе от текущего пользователя.
-        db (AsyncSession): Сеанс базы данных.
+        exclude_rated (bool): исключить пользователей, которых текущий пользователь уже оценил.
+        if_none_match (Optional[str]): ETag ранее полученного ответа.
+        db (AsyncSession): Сеанс базы данных только для чтения (реплика, если она задана).
 
     Returns:
-        dict: словарь, содержащий список пользователей, соответствующих указанным критериям.
+        Response: JSON со списком пользователей, соответствующих указанным критериям.
             Если указан фильтр расстояния, будут включены только пользователи в указанном радиусе.
+            Ответ кэшируется в Redis до добавления новых пользователей. Если таблица пользователей
+            не изменилась с момента ответа с ETag из If-None-Match, возвращается 304 без тела.
 
     Raises:
         HTTPException: Вызывается если текущий пользователь не найден или произошла непредвиденная ошибка.
     """
     try:
-        current_user = (await db.execute(select(sm.User).where(sm.User.email == email))).scalar_one_or_none()
-        if not current_user:
+        # Текущий пользователь и состояние таблицы пользователей для ETag загружаются одним запросом.
+        # Пользователи только добавляются, поэтому состояние таблицы задают максимумы по индексам id и date
+        # без подсчёта строк, который читал бы всю таблицу.
+        users = aliased(sm.User)
+        stamp = select(func.max(users.id), func.max(users.date)).subquery()
+        query = select(sm.User, stamp).join(stamp, true()).where(sm.User.email == email)
+        if exclude_rated:
+            # Оценки текущего пользователя: подзапросы коррелируют со строкой пользователя.
+            query = query.add_columns(
+                select(func.count()).where(sm.Rating.rater_id == sm.User.id).scalar_subquery(),
+                select(func.max(sm.Rating.date)).where(sm.Rating.rater_id == sm.User.id).scalar_subquery(),
+            )
+        row = (await db.execute(query)).one_or_none()
+        if not row:
             raise HTTPException(status_code=404, detail="Пользователь не найден")
+        current_user = row[0]
+
+        params = {"gender": gender, "first_name": first_name, "last_name": last_name,
+                  "sort_by_registration_date": sort_by_registration_date, "distance": distance,
+                  "exclude_rated": exclude_rated or None}
+        etag = list_etag(email, params, *row[1:])
+        if etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers={"ETag": etag})
+
+        # Состояние таблицы входит в ключ кэша: ответ отстающей реплики не попадёт под ключ актуальных данных.
+        body, cache_key = await list_cache.get(params, current_user, row[1:])
+        if body is not None:
+            return Response(content=body, media_type="application/json", headers={"ETag": etag})
 
-        query = select(sm.User)
+        query = select(*USER_COLUMNS)
 
         if gender:
             query = query.where(sm.User.gender == gender)
@@ -58,22 +148,27 @@ async def get_user_list(
             query = query.where(sm.User.first_name.ilike(f"%{first_name}%"))
         if last_name:
             query = query.where(sm.User.last_name.ilike(f"%{last_name}%"))
+        if exclude_rated:
+            # NOT EXISTS использует первичные ключи ratings и rating_pairs (rater_id, rated_id).
+            query = query.where(~rating_exists(current_user.id, sm.User.id))
         if sort_by_registration_date:
             if sort_by_registration_date.lower() == 'asc':
                 query = query.order_by(asc(sm.User.date))
             elif sort_by_registration_date.lower() == 'desc':
                 query = query.order_by(desc(sm.User.date))
         result = await db.execute(query)
-        users = result.scalars().all()
+        users = result.all()
         if distance:
-            users_within_distance = [user for user in users if
-                                     user.latitude and
-                                     user.longitude and
-                                     await calculate_distance(current_user.latitude, current_user.longitude,
-                                                              user.latitude,
-                                                              user.longitude) < distance
-                                     and user.email != current_user.email]
-            return {"users": users_within_distance}
-        return {"users": users}
+            users = [user for user in users if
+                     user.latitude and
+                     user.longitude and
+                     await calculate_distance(current_user.latitude, current_user.longitude,
+                                              user.latitude,
+                                              user.longitude) < distance
+                     and user.email != current_user.email]
+        body = serialize_users(users)
+        if cache_key:
+            await list_cache.set(cache_key, body)
+        return Response(content=body, media_type="application/json", headers={"ETag": etag})
     except Exception as e:
         raise HTTPException(status_code=404, detail="Unexpected error " + str(e))
@@ -0,0 +1,149 @@
+import cProfile
+import logging
+import os
+import random
+import time
+from typing import Optional
+
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from epg import metrics, request_profiler, sql_profiler
+
+logger = logging.getLogger(__name__)
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware, измеряющее длительность запросов по обработчикам и время их этапов.
+
+    Время этапов (db, redis, smtp, watermark, bcrypt) собирается через epg.metrics.stage, записывается
+    в гистограммы и возвращается клиенту в заголовке Server-Timing.
+
+    Args:
+        app (ASGIApp): Оборачиваемое приложение.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        timings = {}
+        token = metrics.stages.set(timings)
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_timing(message: Message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+                headers = MutableHeaders(scope=message)
+                headers.append('Server-Timing', metrics.server_timing(timings, time.perf_counter() - started))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            elapsed = time.perf_counter() - started
+            metrics.stages.reset(token)
+            # Метка — имя обработчика маршрута, а не путь, чтобы не плодить ряды на каждый id.
+            handler = getattr(scope.get('route'), 'name', 'unmatched')
+            metrics.REQUEST_DURATION.observe(elapsed, method=scope['method'], handler=handler, status=status)
+            for name, seconds in timings.items():
+                metrics.STAGE_DURATION.observe(seconds, handler=handler, stage=name)
+
+
+class SQLProfilingMiddleware:
+    """
+    ASGI middleware, собирающее статистику SQL-запросов каждого HTTP-запроса. Подключается только при
+    SQL_PROFILING=1.
+
+    Количество запросов записывается в гистограмму epg_sql_statements_per_request, в лог пишутся их количество,
+    суммарное время и самый медленный запрос, а запросы, повторённые не меньше SQL_REPEATED_QUERY_THRESHOLD раз
+    (по умолчанию 5), логируются как возможная проблема N+1.
+
+    Args:
+        app (ASGIApp): Оборачиваемое приложение.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self.repeated_threshold = int(os.environ.get('SQL_REPEATED_QUERY_THRESHOLD', 5))
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        stats = sql_profiler.QueryStats()
+        token = sql_profiler.current_stats.set(stats)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            sql_profiler.current_stats.reset(token)
+            handler = getattr(scope.get('route'), 'name', 'unmatched')
+            metrics.SQL_STATEMENTS.observe(stats.count, handler=handler)
+            slowest = ''
+            if stats.slowest:
+                seconds, statement = stats.slowest[0]
+                slowest = f"; самый медленный ({seconds * 1000:.1f} мс): {' '.join(statement.split())}"
+            logger.info("%s %s: %d SQL-запросов за %.1f мс%s", scope['method'], scope['path'], stats.count,
+                        stats.total * 1000, slowest)
+            for statement, count in stats.repeated(self.repeated_threshold):
+                logger.warning("Возможная проблема N+1 в %s %s: запрос выполнен %d раз: %s",
+                               scope['method'], scope['path'], count, statement)
+
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware, профилирующее отдельные запросы через cProfile. Подключается только при PROFILING=1,
+    поэтому без этой переменной не добавляет накладных расходов.
+
+    Профилируются запросы с заголовком X-Profile, равным PROFILING_TOKEN, и случайная доля запросов
+    PROFILING_SAMPLE_RATE. Профиль сохраняется в PROFILING_DIR (по умолчанию profiles) в файл с именем
+    обработчика и параметрами запроса. cProfile видит все задачи цикла событий, поэтому одновременно
+    профилируется не больше одного запроса, а профиль может включать чужие задачи.
+
+    Args:
+        app (ASGIApp): Оборачиваемое приложение.
+        directory (Optional[str]): Каталог для профилей.
+        token (Optional[str]): Значение заголовка X-Profile, включающее профилирование.
+        sample_rate (Optional[float]): Доля профилируемых запросов от 0 до 1.
+    """
+
+    def __init__(self, app: ASGIApp, directory: Optional[str] = None, token: Optional[str] = None,
+                 sample_rate: Optional[float] = None):
+        self.app = app
+        self.directory = directory or os.environ.get('PROFILING_DIR', 'profiles')
+        self.token = (token or os.environ.get('PROFILING_TOKEN', '')).encode()
+        self.sample_rate = sample_rate if sample_rate is not None else float(
+            os.environ.get('PROFILING_SAMPLE_RATE', 0))
+        self._active = False
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _requested(self, scope: Scope) -> bool:
+        if self.token and (b'x-profile', self.token) in scope['headers']:
+            return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope['type'] != 'http' or self._active or not self._requested(scope):
+            await self.app(scope, receive, send)
+            return
+
+        self._active = True
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            profiler.disable()
+            self._active = False
+            handler = getattr(scope.get('route'), 'name', 'unmatched')
+            filename = request_profiler.profile_filename(scope['method'], handler,
+                                                         scope['query_string'].decode('latin-1'))
+            profiler.dump_stats(os.path.join(self.directory, filename))
@@ -0,0 +1,45 @@
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import PlainTextResponse
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from epg import metrics
+from epg.dependencies import database
+
+app = APIRouter()
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """
+    Возвращает метрики процесса в текстовом формате Prometheus.
+
+    Returns:
+        PlainTextResponse: Метрики длительности запросов и их этапов.
+    """
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@app.get("/ready")
+async def ready(request: Request, db: AsyncSession = Depends(database)):
+    """
+    Сообщает, готово ли приложение обслуживать запросы.
+
+    Сервер принимает соединения только после прогрева в lifespan, поэтому во время прогрева проба получает
+    отказ в соединении, а не 503. 503 означает, что приложение запущено без lifespan или уже остановлено,
+    либо что основная база данных перестала отвечать после запуска.
+
+    Returns:
+        dict: Статус готовности.
+
+    Raises:
+        HTTPException: 503, если прогрев не выполнен или основная база данных недоступна.
+    """
+    if not getattr(request.app.state, "ready", False):
+        raise HTTPException(status_code=503, detail="Приложение ещё не готово")
+    try:
+        await db.execute(text("SELECT 1"))
+    except (OSError, SQLAlchemyError):
+        raise HTTPException(status_code=503, detail="База данных недоступна")
+    return {"status": "ready"}
@@ -0,0 +1,199 @@
+import asyncio
+import csv
+import datetime
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from itertools import islice
+from typing import Iterable, Iterator, Optional
+
+from pydantic import ValidationError
+from sqlalchemy import insert
+from sqlalchemy.dialects import postgresql, sqlite
+
+from epg.database import api_models as am
+from epg.database import storage_models as sm
+from epg.dependencies import database
+from epg.endpoints.clients import add_watermark, images_path
+
+USER_FIELDS = ('gender', 'first_name', 'last_name', 'email', 'password', 'latitude', 'longitude')
+
+# Кэш водяных знаков внутри процесса-воркера: путь к исходному аватару -> путь к обработанному.
+_avatar_cache: dict[str, str] = {}
+
+
+@dataclass
+class ImportStats:
+    """
+    Итоговая статистика импорта пользователей.
+
+    Attributes:
+        read (int): Количество прочитанных строк.
+        inserted (int): Количество добавленных пользователей.
+        skipped (int): Количество строк, не прошедших проверку.
+        duplicates (int): Количество строк с уже существующей почтой.
+        elapsed (float): Время импорта в секундах.
+    """
+
+    read: int = 0
+    inserted: int = 0
+    skipped: int = 0
+    duplicates: int = 0
+    elapsed: float = 0.0
+
+    @property
+    def rate(self) -> float:
+        return self.read / self.elapsed if self.elapsed else 0.0
+
+
+def read_rows(path: str, fmt: Optional[str] = None) -> Iterator[dict]:
+    """
+    Читает записи пользователей из CSV или JSONL файла.
+
+    Args:
+        path (str): Путь к файлу.
+        fmt (Optional[str]): Формат файла («csv» или «jsonl»). По умолчанию определяется по расширению.
+
+    Yields:
+        dict: Запись пользователя.
+    """
+    fmt = fmt or ('jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv')
+    with open(path, newline='', encoding='utf-8') as file:
+        if fmt == 'csv':
+            yield from csv.DictReader(file)
+        elif fmt == 'jsonl':
+            for line in file:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            raise ValueError(f"Неизвестный формат файла: {fmt}")
+
+
+def _watermark_file(avatar_path: str) -> str:
+    if avatar_path not in _avatar_cache:
+        with open(avatar_path, 'rb') as avatar_file:
+            hash_part = add_watermark(avatar_file.read())
+        _avatar_cache[avatar_path] = os.path.join(images_path, f'{hash_part}.png')
+    return _avatar_cache[avatar_path]
+
+
+def prepare_row(row: dict, base_dir: str, default_avatar: Optional[str], date: datetime.datetime) -> Optional[dict]:
+    """
+    Проверяет запись, хеширует пароль и накладывает водяной знак на аватар. Выполняется в процессе-воркере.
+
+    Args:
+        row (dict): Исходная запись пользователя.
+        base_dir (str): Каталог, относительно которого разрешаются пути к аватарам.
+        default_avatar (Optional[str]): Аватар для записей без поля avatar.
+        date (datetime.datetime): Дата регистрации.
+
+    Returns:
+        Optional[dict]: Параметры для вставки в таблицу users или None, если запись некорректна.
+    """
+    avatar = row.get('avatar') or default_avatar
+    if not avatar:
+        return None
+    try:
+        user = am.User(**{field: row.get(field) for field in USER_FIELDS})
+        avatar_path = _watermark_file(os.path.join(base_dir, avatar))
+    except (ValidationError, OSError):
+        return None
+    return {**user.model_dump(), 'avatar': avatar_path, 'date': date}
+
+
+def _batches(rows: Iterable[dict], size: int) -> Iterator[list[dict]]:
+    iterator = iter(rows)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def _insert_statement(dialect_name: str):
+    if dialect_name == 'sqlite':
+        return sqlite.insert(sm.User).on_conflict_do_nothing(index_elements=['email'])
+    if dialect_name == 'postgresql':
+        return postgresql.insert(sm.User).on_conflict_do_nothing(index_elements=['email'])
+    return insert(sm.User)
+
+
+async def import_users(
+        path: str,
+        fmt: Optional[str] = None,
+        batch_size: int = 1000,
+        commit_every: int = 10,
+        workers: Optional[int] = None,
+        default_avatar: Optional[str] = None,
+        progress=None,
+) -> ImportStats:
+    """
+    Импортирует пользователей из файла пакетными вставками.
+
+    Хеширование паролей и обработка аватаров выполняются в пуле процессов, пока предыдущий пакет
+    вставляется в базу данных. Пакеты вставляются через executemany, транзакция фиксируется
+    раз в commit_every пакетов.
+
+    Args:
+        path (str): Путь к CSV или JSONL файлу.
+        fmt (Optional[str]): Формат файла, по умолчанию определяется по расширению.
+        batch_size (int): Количество записей в одной вставке.
+        commit_every (int): Через сколько пакетов фиксировать транзакцию.
+        workers (Optional[int]): Количество процессов-воркеров.
+        default_avatar (Optional[str]): Аватар для записей без поля avatar.
+        progress: Функция, получающая ImportStats после каждого пакета.
+
+    Returns:
+        ImportStats: Итоговая статистика импорта.
+    """
+    stats = ImportStats()
+    started = time.perf_counter()
+    base_dir = os.path.dirname(os.path.abspath(path))
+    date = datetime.datetime.now()
+    loop = asyncio.get_running_loop()
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        def submit(batch):
+            return [loop.run_in_executor(pool, prepare_row, row, base_dir, default_avatar, date) for row in batch]
+
+        async with database.engine.connect() as conn:
+            statement = _insert_statement(conn.dialect.name)
+            batches = _batches(read_rows(path, fmt), batch_size)
+            pending = submit(next(batches, []))
+            uncommitted = 0
+            while pending:
+                prepared = await asyncio.gather(*pending)
+                # Следующий пакет обрабатывается воркерами, пока текущий вставляется.
+                pending = submit(next(batches, []))
+
+                values = [row for row in prepared if row is not None]
+                stats.read += len(prepared)
+                stats.skipped += len(prepared) - len(values)
+                if values:
+                    result = await conn.execute(statement, values)
+                    inserted = result.rowcount if result.rowcount >= 0 else len(values)
+                    stats.inserted += inserted
+                    stats.duplicates += len(values) - inserted
+                    uncommitted += 1
+                if uncommitted >= commit_every:
+                    await conn.commit()
+                    uncommitted = 0
+
+                stats.elapsed = time.perf_counter() - started
+                if progress:
+                    progress(stats)
+            await conn.commit()
+
+    stats.elapsed = time.perf_counter() - started
+    return stats
+
+
+def print_progress(stats: ImportStats):
+    """
+    Выводит прогресс импорта в stderr.
+
+    Args:
+        stats (ImportStats): Текущая статистика импорта.
+    """
+    print(f"прочитано {stats.read}, добавлено {stats.inserted}, пропущено {stats.skipped}, "
+          f"дубликатов {stats.duplicates}, {stats.rate:.0f} записей/с", file=sys.stderr)
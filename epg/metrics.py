@@ -0,0 +1,184 @@
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Время этапов текущего запроса: этап -> секунды. Словарь создаётся middleware на каждый запрос
+# и разделяется между задачами и потоками, в которые копируется контекст запроса.
+stages: ContextVar[Optional[dict[str, float]]] = ContextVar('epg_stages', default=None)
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Counter:
+    """
+    Монотонно растущий счётчик с метками.
+
+    Args:
+        name (str): Имя метрики.
+        documentation (str): Описание метрики.
+        labelnames (tuple[str, ...]): Имена меток.
+    """
+
+    type = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(tuple(str(labels[name]) for name in self.labelnames), 0)
+
+    def samples(self) -> list[str]:
+        return [f'{self.name}{_labels(self.labelnames, key)} {value}' for key, value in self._values.items()]
+
+
+class Histogram:
+    """
+    Гистограмма с накопительными корзинами в формате Prometheus.
+
+    Args:
+        name (str): Имя метрики.
+        documentation (str): Описание метрики.
+        labelnames (tuple[str, ...]): Имена меток.
+        buckets (tuple[float, ...]): Верхние границы корзин в секундах.
+    """
+
+    type = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = (),
+                 buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self._values: dict[tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        if key not in self._values:
+            self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+        counts, _ = self._values[key]
+        counts[bisect_left(self.buckets, value)] += 1
+        self._values[key][1] += value
+
+    def count(self, **labels) -> int:
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        return sum(self._values[key][0]) if key in self._values else 0
+
+    def samples(self) -> list[str]:
+        lines = []
+        for key, (counts, total) in self._values.items():
+            cumulative = 0
+            for bound, count in zip((*self.buckets, '+Inf'), counts):
+                cumulative += count
+                labels = _labels(self.labelnames, key, f'le="{bound}"')
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            lines.append(f'{self.name}_sum{_labels(self.labelnames, key)} {total}')
+            lines.append(f'{self.name}_count{_labels(self.labelnames, key)} {cumulative}')
+        return lines
+
+
+class Registry:
+    """
+    Реестр метрик процесса. При запуске нескольких воркеров у каждого процесса свой реестр.
+    """
+
+    def __init__(self):
+        self._metrics = []
+
+    def counter(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()) -> Counter:
+        metric = Counter(name, documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, documentation: str, labelnames: tuple[str, ...] = (),
+                  buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        metric = Histogram(name, documentation, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """
+        Возвращает все метрики в текстовом формате Prometheus.
+        """
+        lines = []
+        for metric in self._metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+REQUEST_DURATION = registry.histogram(
+    'epg_request_duration_seconds', 'Длительность обработки запроса', ('method', 'handler', 'status'))
+STAGE_DURATION = registry.histogram(
+    'epg_stage_duration_seconds', 'Время этапа обработки запроса', ('handler', 'stage'))
+SQL_STATEMENTS = registry.histogram(
+    'epg_sql_statements_per_request', 'Количество SQL-запросов за HTTP-запрос (при SQL_PROFILING=1)',
+    ('handler',), buckets=(1, 2, 3, 5, 10, 20, 50, 100))
+
+
+def record_stage(name: str, seconds: float):
+    """
+    Добавляет время к этапу текущего запроса. Вне запроса ничего не делает.
+
+    Args:
+        name (str): Название этапа (db, redis, smtp, watermark, bcrypt).
+        seconds (float): Затраченное время в секундах.
+    """
+    timings = stages.get()
+    if timings is not None:
+        timings[name] = timings.get(name, 0.0) + seconds
+
+
+@contextmanager
+def stage(name: str):
+    """
+    Измеряет время блока кода и относит его к этапу текущего запроса. Может использоваться как декоратор
+    синхронных функций.
+
+    Args:
+        name (str): Название этапа.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - started)
+
+
+def server_timing(timings: dict[str, float], total: float) -> str:
+    """
+    Формирует значение заголовка Server-Timing.
+
+    Args:
+        timings (dict[str, float]): Время этапов в секундах.
+        total (float): Общее время обработки запроса в секундах.
+
+    Returns:
+        str: Значение заголовка, например «db;dur=1.2, total;dur=3.4».
+    """
+    parts = [f'{name};dur={seconds * 1000:.1f}' for name, seconds in timings.items()]
+    parts.append(f'total;dur={total * 1000:.1f}')
+    return ', '.join(parts)
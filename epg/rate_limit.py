@@ -0,0 +1,188 @@
+import math
+import os
+import time
+from collections import OrderedDict
+from typing import Callable, Optional
+
+import redis.asyncio as redis
+from fastapi import Depends, HTTPException, Request
+
+from epg import metrics
+from epg.dependencies import Storage, client_keys, storage
+
+RATE_LIMITED = metrics.registry.counter(
+    'epg_rate_limited_total', 'Запросы, отклонённые ограничением частоты, по правилу и хранилищу', ('rule', 'backend'))
+
+# Корзина токенов: токены восполняются со скоростью rate в секунду до capacity. Время берётся из Redis,
+# поэтому все экземпляры приложения считают его одинаково. Возвращает {разрешено, миллисекунд до токена}.
+TOKEN_BUCKET_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local allowed = 0
+local retry_after = 0
+if tokens >= cost then
+    tokens = tokens - cost
+    allowed = 1
+else
+    retry_after = math.ceil((cost - tokens) / rate * 1000)
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate * 1000))
+return {allowed, retry_after}
+"""
+
+
+def parse_rule(value: str) -> tuple[int, float]:
+    """
+    Разбирает правило ограничения вида «capacity/seconds».
+
+    Args:
+        value (str): Правило, например «20/60» — 20 запросов за 60 секунд.
+
+    Returns:
+        tuple[int, float]: Ёмкость корзины и период её полного восполнения в секундах.
+    """
+    capacity, _, period = value.partition('/')
+    capacity, period = int(capacity), float(period or 1)
+    if capacity <= 0 or period <= 0:
+        raise ValueError(f"Некорректное правило ограничения частоты: {value}")
+    return capacity, period
+
+
+class LocalTokenBucket:
+    """
+    Корзина токенов в памяти процесса. Используется, когда Redis недоступен.
+
+    Args:
+        capacity (int): Ёмкость корзины.
+        rate (float): Скорость восполнения в токенах в секунду.
+        max_keys (int): Максимальное количество хранимых корзин; самые давние вытесняются.
+    """
+
+    def __init__(self, capacity: int, rate: float, max_keys: int = 10000):
+        self.capacity = capacity
+        self.rate = rate
+        self.max_keys = max_keys
+        self.buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+
+    def take(self, key: str, cost: int = 1, now: Optional[float] = None) -> float:
+        """
+        Забирает токены из корзины.
+
+        Args:
+            key (str): Ключ корзины.
+            cost (int): Количество токенов.
+            now (Optional[float]): Текущее время в секундах, по умолчанию time.monotonic().
+
+        Returns:
+            float: 0, если токены выданы, иначе количество секунд до появления нужного количества токенов.
+        """
+        now = time.monotonic() if now is None else now
+        tokens, ts = self.buckets.pop(key, (self.capacity, now))
+        tokens = min(self.capacity, tokens + max(0.0, now - ts) * self.rate)
+        retry_after = 0.0
+        if tokens >= cost:
+            tokens -= cost
+        else:
+            retry_after = (cost - tokens) / self.rate
+        self.buckets[key] = (tokens, now)
+        if len(self.buckets) > self.max_keys:
+            self.buckets.popitem(last=False)
+        return retry_after
+
+
+class RateLimiter:
+    """
+    Зависимость FastAPI, ограничивающая частоту запросов к маршруту корзиной токенов.
+
+    Корзины ведутся атомарным Lua-скриптом в Redis отдельно для IP-адреса клиента и для почты из параметра
+    email: запрос списывает токен из обеих, поэтому подстановка чужой или случайной почты не обходит
+    ограничение по IP-адресу. Если Redis недоступен или вернул ошибку, используются корзины в памяти процесса.
+    При исчерпании токенов возвращается 429 с заголовком Retry-After.
+
+    Args:
+        name (str): Имя правила, используется в ключах Redis и метриках.
+        capacity (int): Ёмкость корзины — количество запросов подряд.
+        period (float): Время полного восполнения корзины в секундах.
+        storage (Storage): Хранилище Redis.
+        when (Optional[Callable[[Request], bool]]): Условие, при котором запрос учитывается.
+    """
+
+    def __init__(self, name: str, capacity: int, period: float, storage: Storage = storage,
+                 when: Optional[Callable[[Request], bool]] = None):
+        self.name = name
+        self.capacity = capacity
+        self.rate = capacity / period
+        self.storage = storage
+        self.when = when
+        self.local = LocalTokenBucket(capacity, self.rate)
+        self._script = None
+
+    @classmethod
+    def from_env(cls, name: str, **kwargs) -> Optional['RateLimiter']:
+        """
+        Создаёт ограничитель по переменной окружения RATE_LIMIT_<NAME> вида «capacity/seconds».
+
+        Returns:
+            Optional[RateLimiter]: Ограничитель или None, если переменная не задана.
+        """
+        value = os.environ.get(f'RATE_LIMIT_{name.upper()}')
+        if not value:
+            return None
+        return cls(name, *parse_rule(value), **kwargs)
+
+    async def take(self, identity: str) -> tuple[float, str]:
+        """
+        Забирает токен из корзины клиента.
+
+        Args:
+            identity (str): Идентификатор клиента.
+
+        Returns:
+            tuple[float, str]: Секунды до появления токена (0, если запрос разрешён) и использованное хранилище.
+        """
+        key = f'ratelimit:{self.name}:{identity}'
+        try:
+            client = await self.storage()
+            if client:
+                if self._script is None or self._script.registered_client is not client:
+                    self._script = client.register_script(TOKEN_BUCKET_SCRIPT)
+                allowed, retry_after = await self._script(keys=[key], args=[self.capacity, self.rate, 1])
+                return (0.0 if allowed else retry_after / 1000), 'redis'
+        except redis.RedisError:
+            pass
+        return self.local.take(key), 'local'
+
+    async def __call__(self, request: Request):
+        if self.when and not self.when(request):
+            return
+        for identity in client_keys(request):
+            retry_after, backend = await self.take(identity)
+            if retry_after:
+                break
+        if retry_after:
+            RATE_LIMITED.inc(rule=self.name, backend=backend)
+            raise HTTPException(status_code=429, detail="Слишком много запросов",
+                                headers={"Retry-After": str(max(1, math.ceil(retry_after)))})
+
+
+def rate_limit(name: str, **kwargs) -> list:
+    """
+    Возвращает зависимости маршрута для правила RATE_LIMIT_<NAME>: пустой список, если правило не задано.
+
+    Args:
+        name (str): Имя правила.
+        **kwargs: Параметры RateLimiter.
+
+    Returns:
+        list: Список для параметра dependencies маршрута.
+    """
+    limiter = RateLimiter.from_env(name, **kwargs)
+    return [Depends(limiter)] if limiter else []
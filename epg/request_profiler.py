@@ -0,0 +1,56 @@
+import glob
+import io
+import os
+import pstats
+import re
+import time
+from typing import Optional
+
+
+def enabled() -> bool:
+    """
+    Проверяет, включено ли профилирование запросов переменной окружения PROFILING.
+    """
+    return os.environ.get('PROFILING', '').lower() in ('1', 'true', 'yes')
+
+
+def profile_filename(method: str, handler: str, query_string: str) -> str:
+    """
+    Формирует имя файла профиля из времени, метода, обработчика и параметров запроса.
+
+    Args:
+        method (str): HTTP-метод.
+        handler (str): Имя обработчика маршрута.
+        query_string (str): Строка параметров запроса.
+
+    Returns:
+        str: Имя файла вида «1730000000000_GET_get_user_list_email=a_example.com_distance=5.pstats».
+    """
+    params = re.sub(r'[^A-Za-z0-9=._-]+', '_', query_string)[:120]
+    parts = [str(int(time.time() * 1000)), method, handler] + ([params] if params else [])
+    return '_'.join(parts) + '.pstats'
+
+
+def summarize(directory: str, top: int = 30, sort: str = 'cumulative', pattern: Optional[str] = None) -> str:
+    """
+    Объединяет собранные профили и возвращает самые затратные функции.
+
+    Args:
+        directory (str): Каталог с файлами .pstats.
+        top (int): Количество выводимых функций.
+        sort (str): Ключ сортировки pstats (cumulative, tottime, ncalls).
+        pattern (Optional[str]): Подстрока имени файла для отбора профилей, например имя обработчика.
+
+    Returns:
+        str: Отчёт pstats.
+    """
+    files = sorted(glob.glob(os.path.join(directory, '*.pstats')))
+    if pattern:
+        files = [file for file in files if pattern in os.path.basename(file)]
+    if not files:
+        return f"В {directory} нет профилей"
+    output = io.StringIO()
+    stats = pstats.Stats(*files, stream=output)
+    output.write(f"Профилей: {len(files)}\n")
+    stats.strip_dirs().sort_stats(sort).print_stats(top)
+    return output.getvalue()
@@ -0,0 +1,268 @@
+import asyncio
+import datetime
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Optional
+
+from sqlalchemy import delete, exists, func, insert, or_, select, text, tuple_
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.sql import CompoundSelect
+
+from epg import metrics
+from epg.database import storage_models as sm
+from epg.dependencies import Database, database
+
+logger = logging.getLogger(__name__)
+
+RATINGS_ARCHIVED = metrics.registry.counter(
+    'epg_ratings_archived_total', 'Оценки, перенесённые из ratings в ratings_archive')
+
+# Ключ рекомендательной блокировки PostgreSQL, под которой выполняется перенос в приложении.
+ARCHIVE_LOCK_ID = 0x6570675f61726368
+
+
+def rating_exists(rater_id, rated_id):
+    """
+    Условие «оценка существует» с учётом оценок, перенесённых в архив.
+
+    Args:
+        rater_id: Идентификатор оценившего пользователя или выражение SQL.
+        rated_id: Идентификатор оценённого пользователя или выражение SQL.
+
+    Returns:
+        Выражение SQL.
+    """
+    return or_(
+        exists().where(sm.Rating.rater_id == rater_id, sm.Rating.rated_id == rated_id),
+        exists().where(sm.RatingPair.rater_id == rater_id, sm.RatingPair.rated_id == rated_id),
+    )
+
+
+def existing_pairs(pairs) -> CompoundSelect:
+    """
+    Запрос пар (rater_id, rated_id) из pairs, которые уже есть в ratings или в архиве.
+    """
+    return select(sm.Rating.rater_id, sm.Rating.rated_id).where(
+        tuple_(sm.Rating.rater_id, sm.Rating.rated_id).in_(pairs)
+    ).union(select(sm.RatingPair.rater_id, sm.RatingPair.rated_id).where(
+        tuple_(sm.RatingPair.rater_id, sm.RatingPair.rated_id).in_(pairs)))
+
+
+def insert_ignore(dialect_name: str, model):
+    """
+    Вставка, пропускающая строки с уже существующим ключом (ON CONFLICT DO NOTHING на SQLite и PostgreSQL).
+    """
+    if dialect_name == 'sqlite':
+        return sqlite.insert(model).on_conflict_do_nothing()
+    if dialect_name == 'postgresql':
+        return postgresql.insert(model).on_conflict_do_nothing()
+    return insert(model)
+
+
+@dataclass
+class ArchiveStats:
+    """
+    Статистика переноса оценок в архив.
+
+    Attributes:
+        moved (int): Количество перенесённых оценок.
+        batches (int): Количество пакетов (транзакций).
+        elapsed (float): Время переноса в секундах.
+    """
+
+    moved: int = 0
+    batches: int = 0
+    elapsed: float = 0.0
+
+
+class RatingArchiver:
+    """
+    Переносит оценки старше retention в ratings_archive и запоминает их пары в rating_pairs.
+
+    Перенос идёт короткими транзакциями по batch_size оценок с паузой между ними, чтобы не блокировать
+    запись новых оценок. По rating_pairs проверки повторной оценки и взаимной симпатии продолжают учитывать
+    перенесённые оценки, а дневной лимит считается по ratings, поэтому retention не может быть меньше суток.
+    На PostgreSQL с секционированным архивом перед переносом создаются месячные секции. Периодический перенос
+    в приложении выполняется под межпроцессной блокировкой, поэтому из нескольких воркеров переносит один.
+
+    Args:
+        database (Database): База данных.
+        retention (datetime.timedelta): Сколько хранить оценки в ratings.
+        batch_size (int): Количество оценок в одной транзакции.
+        pause (float): Пауза между транзакциями в секундах.
+    """
+
+    def __init__(self, database: Database, retention: datetime.timedelta, batch_size: int = 1000,
+                 pause: float = 0.05):
+        if retention < datetime.timedelta(days=1):
+            raise ValueError("Оценки должны храниться в ratings не меньше суток для проверки дневного лимита")
+        self.database = database
+        self.retention = retention
+        self.batch_size = batch_size
+        self.pause = pause
+        self._partitioned: Optional[bool] = None
+        self._partitions: set[str] = set()
+
+    async def _ensure_partitions(self, conn, dates: list[datetime.datetime]):
+        if conn.dialect.name != 'postgresql':
+            return
+        if self._partitioned is None:
+            self._partitioned = bool((await conn.execute(text(
+                "SELECT 1 FROM pg_partitioned_table WHERE partrelid = 'ratings_archive'::regclass"
+            ))).scalar())
+        if not self._partitioned:
+            return
+        for month in {date.replace(day=1, hour=0, minute=0, second=0, microsecond=0) for date in dates}:
+            name = f'ratings_archive_{month:%Y_%m}'
+            if name in self._partitions:
+                continue
+            following = (month + datetime.timedelta(days=32)).replace(day=1)
+            await conn.execute(text(
+                f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF ratings_archive "
+                f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{following:%Y-%m-%d}')"
+            ))
+            self._partitions.add(name)
+
+    async def archive_batch(self, cutoff: datetime.datetime) -> int:
+        """
+        Переносит в архив одну пачку оценок старше cutoff.
+
+        Returns:
+            int: Количество перенесённых оценок.
+        """
+        async with self.database.engine.begin() as conn:
+            rows = (await conn.execute(
+                select(sm.Rating.rater_id, sm.Rating.rated_id, sm.Rating.date)
+                .where(sm.Rating.date < cutoff)
+                .order_by(sm.Rating.date)
+                .limit(self.batch_size)
+            )).all()
+            if not rows:
+                return 0
+            await self._ensure_partitions(conn, [row.date for row in rows])
+            await conn.execute(insert_ignore(conn.dialect.name, sm.RatingArchive),
+                               [row._asdict() for row in rows])
+            await conn.execute(insert_ignore(conn.dialect.name, sm.RatingPair),
+                               [{'rater_id': row.rater_id, 'rated_id': row.rated_id} for row in rows])
+            await conn.execute(delete(sm.Rating).where(
+                tuple_(sm.Rating.rater_id, sm.Rating.rated_id).in_([(row.rater_id, row.rated_id) for row in rows])))
+        RATINGS_ARCHIVED.inc(len(rows))
+        return len(rows)
+
+    async def run(self, limit: Optional[int] = None) -> ArchiveStats:
+        """
+        Переносит в архив все оценки старше retention.
+
+        Args:
+            limit (Optional[int]): Максимальное количество переносимых оценок за запуск.
+
+        Returns:
+            ArchiveStats: Статистика переноса.
+        """
+        stats = ArchiveStats()
+        started = time.perf_counter()
+        cutoff = datetime.datetime.now() - self.retention
+        while limit is None or stats.moved < limit:
+            moved = await self.archive_batch(cutoff)
+            if not moved:
+                break
+            stats.moved += moved
+            stats.batches += 1
+            await asyncio.sleep(self.pause)
+        stats.elapsed = time.perf_counter() - started
+        return stats
+
+    @asynccontextmanager
+    async def lock(self):
+        """
+        Межпроцессная блокировка переноса без ожидания: рекомендательная блокировка на PostgreSQL и блокировка
+        файла рядом с базой на SQLite. Для баз в памяти и других СУБД блокировка считается полученной.
+
+        Yields:
+            bool: Получена ли блокировка.
+        """
+        url = self.database.engine.url
+        if url.get_backend_name() == 'postgresql':
+            async with self.database.engine.connect() as conn:
+                conn = await conn.execution_options(isolation_level='AUTOCOMMIT')
+                locked = (await conn.execute(select(func.pg_try_advisory_lock(ARCHIVE_LOCK_ID)))).scalar()
+                try:
+                    yield locked
+                finally:
+                    if locked:
+                        await conn.execute(select(func.pg_advisory_unlock(ARCHIVE_LOCK_ID)))
+        elif url.get_backend_name() == 'sqlite' and url.database not in (None, '', ':memory:'):
+            import fcntl
+
+            # Блокировка снимается при закрытии файла, в том числе при аварийном завершении процесса.
+            with open(f'{url.database}.archive.lock', 'w') as file:
+                try:
+                    fcntl.flock(file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    locked = True
+                except BlockingIOError:
+                    locked = False
+                yield locked
+        else:
+            yield True
+
+    async def _run_periodically(self, interval: float):
+        while True:
+            try:
+                async with self.lock() as locked:
+                    stats = await self.run() if locked else None
+                if stats and stats.moved:
+                    logger.info("Перенесено в архив оценок: %d за %.1f с", stats.moved, stats.elapsed)
+            except Exception:
+                logger.exception("Не удалось перенести оценки в архив")
+            await asyncio.sleep(interval)
+
+    @asynccontextmanager
+    async def running(self, interval: float):
+        """
+        Запускает перенос в архив раз в interval секунд на время блока.
+        """
+        task = asyncio.create_task(self._run_periodically(interval))
+        try:
+            yield self
+        finally:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+
+def archiver_from_env() -> Optional[RatingArchiver]:
+    """
+    Создаёт RatingArchiver по RATINGS_RETENTION_DAYS, RATINGS_ARCHIVE_BATCH_SIZE и RATINGS_ARCHIVE_PAUSE_MS.
+
+    Returns:
+        Optional[RatingArchiver]: Архиватор или None, если RATINGS_RETENTION_DAYS не задана.
+    """
+    days = os.environ.get('RATINGS_RETENTION_DAYS')
+    if not days:
+        return None
+    return RatingArchiver(
+        database,
+        retention=datetime.timedelta(days=float(days)),
+        batch_size=int(os.environ.get('RATINGS_ARCHIVE_BATCH_SIZE', 1000)),
+        pause=float(os.environ.get('RATINGS_ARCHIVE_PAUSE_MS', 50)) / 1000,
+    )
+
+
+@asynccontextmanager
+async def running():
+    """
+    Запускает фоновый перенос оценок в архив, если задана RATINGS_RETENTION_DAYS. Интервал между запусками —
+    RATINGS_ARCHIVE_INTERVAL_SECONDS (по умолчанию 3600). Каждый воркер запускает свой цикл, но переносит
+    только получивший блокировку RatingArchiver.lock.
+    """
+    archiver = archiver_from_env()
+    if not archiver:
+        yield None
+        return
+    async with archiver.running(float(os.environ.get('RATINGS_ARCHIVE_INTERVAL_SECONDS', 3600))):
+        yield archiver
@@ -0,0 +1,155 @@
+import logging
+import os
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Optional
+from weakref import WeakKeyDictionary
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from epg import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def enabled() -> bool:
+    """
+    Проверяет, включено ли профилирование SQL переменной окружения SQL_PROFILING.
+    """
+    return os.environ.get('SQL_PROFILING', '').lower() in ('1', 'true', 'yes')
+
+
+@dataclass
+class QueryStats:
+    """
+    Статистика SQL-запросов за один HTTP-запрос или за блок кода в тестах.
+
+    Attributes:
+        count (int): Количество выполненных запросов.
+        total (float): Суммарное время выполнения в секундах.
+        statements (Counter): Количество выполнений каждого текста запроса.
+        slowest (list[tuple[float, str]]): Самые медленные запросы (время, текст), по убыванию времени.
+    """
+
+    count: int = 0
+    total: float = 0.0
+    statements: Counter = field(default_factory=Counter)
+    slowest: list[tuple[float, str]] = field(default_factory=list)
+    keep_slowest: int = 5
+
+    def record(self, statement: str, seconds: float):
+        self.count += 1
+        self.total += seconds
+        self.statements[statement] += 1
+        self.slowest.append((seconds, statement))
+        self.slowest.sort(key=lambda item: item[0], reverse=True)
+        del self.slowest[self.keep_slowest:]
+
+    def repeated(self, threshold: int) -> list[tuple[str, int]]:
+        """
+        Возвращает запросы, выполненные не меньше threshold раз — признак проблемы N+1.
+        """
+        return [(statement, count) for statement, count in self.statements.items() if count >= threshold]
+
+
+# Статистика текущего HTTP-запроса, устанавливается SQLProfilingMiddleware.
+current_stats: ContextVar[Optional[QueryStats]] = ContextVar('epg_sql_stats', default=None)
+
+
+class SQLProfiler:
+    """
+    Слушатели before_cursor_execute/after_cursor_execute и handle_error, замеряющие запросы к базе данных.
+
+    Время каждого запроса добавляется к этапу db текущего HTTP-запроса, в статистику из current_stats
+    и во все статистики, открытые capture для этого движка.
+
+    Args:
+        slow_query_threshold (Optional[float]): Порог в секундах, начиная с которого запрос логируется
+            вместе с параметрами. None — не логировать.
+    """
+
+    def __init__(self, slow_query_threshold: Optional[float] = None):
+        self.slow_query_threshold = slow_query_threshold
+        self.captured: list[QueryStats] = []
+
+    def attach(self, engine: Engine):
+        event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+        event.listen(engine, 'handle_error', self._handle_error)
+        _profilers[engine] = self
+
+    def detach(self, engine: Engine):
+        event.remove(engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.remove(engine, 'after_cursor_execute', self._after_cursor_execute)
+        event.remove(engine, 'handle_error', self._handle_error)
+        _profilers.pop(engine, None)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self._finish(conn.info['query_started'].pop(), statement, parameters)
+
+    def _handle_error(self, context):
+        # После ошибки запроса after_cursor_execute не вызывается: снимаем время его начала со стека соединения.
+        started = context.connection.info.get('query_started') if context.connection is not None else None
+        if started and context.execution_context is not None:
+            self._finish(started.pop(), context.statement, context.parameters)
+
+    def _finish(self, started: float, statement: str, parameters):
+        seconds = time.perf_counter() - started
+        metrics.record_stage('db', seconds)
+        if (stats := current_stats.get()) is not None:
+            stats.record(statement, seconds)
+        for stats in self.captured:
+            stats.record(statement, seconds)
+        if self.slow_query_threshold is not None and seconds >= self.slow_query_threshold:
+            logger.warning("Медленный запрос (%.1f мс): %s; параметры: %r", seconds * 1000, statement, parameters)
+
+
+# Профилировщики, подключённые к движкам.
+_profilers: WeakKeyDictionary = WeakKeyDictionary()
+
+
+def from_env() -> SQLProfiler:
+    """
+    Создаёт профилировщик по переменным окружения SQL_PROFILING и SQL_SLOW_QUERY_MS (по умолчанию 100).
+
+    Returns:
+        SQLProfiler: Профилировщик; медленные запросы логируются, только если профилирование включено.
+    """
+    if not enabled():
+        return SQLProfiler()
+    return SQLProfiler(slow_query_threshold=float(os.environ.get('SQL_SLOW_QUERY_MS', 100)) / 1000)
+
+
+@contextmanager
+def capture(engine: Engine):
+    """
+    Считает все запросы, выполненные через engine внутри блока, независимо от контекста запроса.
+
+    Если к движку не подключён профилировщик, на время блока подключается временный.
+
+    Args:
+        engine (Engine): Синхронный движок (для AsyncEngine — его sync_engine).
+
+    Yields:
+        QueryStats: Статистика, заполняемая по мере выполнения запросов.
+    """
+    profiler = _profilers.get(engine)
+    temporary = profiler is None
+    if temporary:
+        profiler = SQLProfiler()
+        profiler.attach(engine)
+    stats = QueryStats()
+    profiler.captured.append(stats)
+    try:
+        yield stats
+    finally:
+        profiler.captured.remove(stats)
+        if temporary:
+            profiler.detach(engine)
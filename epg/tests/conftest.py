@@ -1,5 +1,7 @@
 import os
+from contextlib import contextmanager
 
+import pytest
 import pytest_asyncio
 from dotenv import load_dotenv
 from sqlalchemy.ext.asyncio import create_async_engine
@@ -10,3 +12,25 @@ load_dotenv()
 @pytest_asyncio.fixture()
 async def db():
     return create_async_engine(os.environ.get('DATABASE_URL'))
+
+
+@pytest.fixture()
+def assert_max_queries():
+    """
+    Проверяет, что блок кода выполнил не больше указанного количества SQL-запросов через движок приложения.
+
+    Пример:
+        with assert_max_queries(2):
+            client.get("/api/list", params={"email": TEST_EMAIL})
+    """
+    from epg import sql_profiler
+    from epg.dependencies import database
+
+    @contextmanager
+    def assert_max(limit: int):
+        with sql_profiler.capture(database.engine.sync_engine) as stats:
+            yield stats
+        statements = '\n'.join(f'{count} x {statement}' for statement, count in stats.statements.items())
+        assert stats.count <= limit, f"Выполнено {stats.count} SQL-запросов, допустимо {limit}:\n{statements}"
+
+    return assert_max
@@ -1,13 +1,16 @@
+import asyncio
 import os
 from pathlib import Path
 
+import httpx
 import pytest
 from fastapi.testclient import TestClient
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from epg.database import storage_models as sm
-from epg.endpoints import app
+from epg.dependencies import Database, database
+from epg.endpoints import app, clients
 
 client = TestClient(app)
 
@@ -162,6 +165,7 @@ async def test_get_user_list(db):
     assert response.status_code == 200
     users = response.json()['users']
     assert all(user["first_name"] == "first_name1" for user in users)
+    assert all("password" not in user for user in users)
 
     response = client.get("/api/list", params={"gender": "male", "email": TEST_EMAIL})
     assert response.status_code == 200
@@ -243,3 +247,195 @@ async def test_get_users_within_distance(db):
     await delete_user(db, current_user_email)
     await delete_user(db, nearby_user_email)
     await delete_user(db, distant_user_email)
+
+
+@pytest.mark.asyncio
+async def test_query_counts(db, assert_max_queries):
+    await register_user(TEST_EMAIL)
+    await register_user(DUPLICATE_EMAIL)
+    test_user = await get_user(db, TEST_EMAIL)
+    duplicate_user = await get_user(db, DUPLICATE_EMAIL)
+
+    with assert_max_queries(2):
+        response = client.get("/api/list", params={"email": TEST_EMAIL})
+    assert response.status_code == 200
+
+    with assert_max_queries(2):
+        response = client.get("/api/list", params={"email": TEST_EMAIL, "distance": 100})
+    assert response.status_code == 200
+
+    with assert_max_queries(6):
+        response = client.post(f"/api/clients/{duplicate_user.id}/match", params={"email": TEST_EMAIL})
+    assert response.json()["message"] == "Оценка добавлена"
+
+    with assert_max_queries(6):
+        response = client.post(f"/api/clients/{test_user.id}/match", params={"email": DUPLICATE_EMAIL})
+    assert response.json()["message"] == "Взаимная симпатия! Проверьте почту"
+
+    await delete_match(db, test_user.id, duplicate_user.id)
+    await delete_match(db, duplicate_user.id, test_user.id)
+    await delete_user(db, TEST_EMAIL)
+    await delete_user(db, DUPLICATE_EMAIL)
+
+
+@pytest.mark.asyncio
+async def test_match_batch(db, assert_max_queries, monkeypatch):
+    sent = []
+
+    async def send(recipient, message):
+        sent.append(recipient)
+
+    monkeypatch.setattr(clients, "email_sender", send)
+    emails = [TEST_EMAIL, DUPLICATE_EMAIL] + [f"{i}" + TEST_EMAIL for i in range(5)]
+    for email in emails:
+        await register_user(email)
+    test_user, duplicate_user, *others = [await get_user(db, email) for email in emails]
+    client.post(f"/api/clients/{test_user.id}/match", params={"email": DUPLICATE_EMAIL})
+
+    ids = [duplicate_user.id, test_user.id, 999999999] + [user.id for user in others] + [duplicate_user.id]
+    with assert_max_queries(5):
+        response = client.post("/api/clients/match", params={"email": TEST_EMAIL}, json={"ids": ids})
+    assert response.status_code == 200
+    assert [result["status"] for result in response.json()["results"]] == [
+        "mutual", "self", "not_found", "rated", "rated", "rated", "rated", "limit_exceeded"]
+    assert sorted(sent) == sorted([TEST_EMAIL, DUPLICATE_EMAIL])
+
+    response = client.post("/api/clients/match", params={"email": TEST_EMAIL}, json={"ids": [others[0].id]})
+    assert response.json()["results"] == [{"id": others[0].id, "status": "already_rated"}]
+    response = client.post("/api/clients/match", params={"email": "missing@example.com"}, json={"ids": [1]})
+    assert response.status_code == 404
+
+    await delete_match(db, duplicate_user.id, test_user.id)
+    for user in [duplicate_user, *others]:
+        await delete_match(db, test_user.id, user.id)
+    for email in emails:
+        await delete_user(db, email)
+
+
+@pytest.mark.asyncio
+async def test_match_batch_concurrent_limit(db):
+    emails = [TEST_EMAIL] + [f"{i}" + TEST_EMAIL for i in range(8)]
+    for email in emails:
+        await register_user(email)
+    rater, *others = [await get_user(db, email) for email in emails]
+
+    # Два одновременных пакета по 4 оценки при лимите 5: второй пакет должен увидеть оценки первого.
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app), base_url="http://testserver") as async_client:
+        responses = await asyncio.gather(*(
+            async_client.post("/api/clients/match", params={"email": TEST_EMAIL},
+                              json={"ids": [user.id for user in batch]})
+            for batch in (others[:4], others[4:])
+        ))
+    statuses = [result["status"] for response in responses for result in response.json()["results"]]
+    assert statuses.count("rated") == 5
+    assert statuses.count("limit_exceeded") == 3
+
+    for user in others:
+        await delete_match(db, rater.id, user.id)
+    for email in emails:
+        await delete_user(db, email)
+
+
+@pytest.mark.asyncio
+async def test_match_single_and_batch_concurrent_limit(db):
+    emails = [TEST_EMAIL] + [f"{i}" + TEST_EMAIL for i in range(6)]
+    for email in emails:
+        await register_user(email)
+    rater, *others = [await get_user(db, email) for email in emails]
+
+    # Пакет из 4 оценок и две одиночные оценки одновременно при лимите 5: одна из них должна упереться в лимит.
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app), base_url="http://testserver") as async_client:
+        batch, *singles = await asyncio.gather(
+            async_client.post("/api/clients/match", params={"email": TEST_EMAIL},
+                              json={"ids": [user.id for user in others[:4]]}),
+            *(async_client.post(f"/api/clients/{user.id}/match", params={"email": TEST_EMAIL})
+              for user in others[4:]),
+        )
+    statuses = [result["status"] for result in batch.json()["results"]]
+    assert statuses.count("rated") + [response.status_code for response in singles].count(200) == 5
+    assert statuses.count("limit_exceeded") + [response.status_code for response in singles].count(429) == 1
+
+    for user in others:
+        await delete_match(db, rater.id, user.id)
+    for email in emails:
+        await delete_user(db, email)
+
+
+@pytest.mark.asyncio
+async def test_get_user_list_etag(db, assert_max_queries):
+    await register_user(TEST_EMAIL)
+
+    response = client.get("/api/list", params={"email": TEST_EMAIL, "gender": "male"})
+    assert response.status_code == 200
+    etag = response.headers["ETag"]
+
+    with assert_max_queries(1) as stats:
+        response = client.get("/api/list", params={"email": TEST_EMAIL, "gender": "male"},
+                              headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert not any("count(" in statement.lower() for statement in stats.statements)
+    assert response.content == b""
+
+    response = client.get("/api/list", params={"email": TEST_EMAIL, "gender": "female"},
+                          headers={"If-None-Match": etag})
+    assert response.status_code == 200
+
+    await register_user(DUPLICATE_EMAIL)
+    response = client.get("/api/list", params={"email": TEST_EMAIL, "gender": "male"},
+                          headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+    await delete_user(db, TEST_EMAIL)
+    await delete_user(db, DUPLICATE_EMAIL)
+
+
+@pytest.mark.asyncio
+async def test_get_user_list_exclude_rated(db, assert_max_queries):
+    await register_user(TEST_EMAIL)
+    await register_user(DUPLICATE_EMAIL)
+    test_user = await get_user(db, TEST_EMAIL)
+    duplicate_user = await get_user(db, DUPLICATE_EMAIL)
+
+    response = client.get("/api/list", params={"email": TEST_EMAIL, "exclude_rated": True})
+    assert any(user["email"] == DUPLICATE_EMAIL for user in response.json()["users"])
+    etag = response.headers["ETag"]
+
+    client.post(f"/api/clients/{duplicate_user.id}/match", params={"email": TEST_EMAIL})
+
+    with assert_max_queries(2):
+        response = client.get("/api/list", params={"email": TEST_EMAIL, "exclude_rated": True, "distance": 100},
+                              headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert not any(user["email"] == DUPLICATE_EMAIL for user in response.json()["users"])
+
+    response = client.get("/api/list", params={"email": TEST_EMAIL, "exclude_rated": True},
+                          headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert not any(user["email"] == DUPLICATE_EMAIL for user in response.json()["users"])
+
+    response = client.get("/api/list", params={"email": DUPLICATE_EMAIL, "exclude_rated": True})
+    assert any(user["email"] == TEST_EMAIL for user in response.json()["users"])
+
+    await delete_match(db, test_user.id, duplicate_user.id)
+    await delete_user(db, TEST_EMAIL)
+    await delete_user(db, DUPLICATE_EMAIL)
+
+
+def test_readiness(tmp_path):
+    assert client.get("/api/ready").status_code == 503
+    with TestClient(app) as lifespan_client:
+        response = lifespan_client.get("/api/ready")
+        assert response.status_code == 200
+        assert response.json() == {"status": "ready"}
+
+        # После запуска база перестала отвечать.
+        unavailable = Database(f"sqlite+aiosqlite:///{tmp_path}/missing/database.db")
+        app.dependency_overrides[database] = unavailable
+        try:
+            response = lifespan_client.get("/api/ready")
+        finally:
+            app.dependency_overrides.clear()
+        assert response.status_code == 503
+        assert response.json()["detail"] == "База данных недоступна"
+    assert client.get("/api/ready").status_code == 503
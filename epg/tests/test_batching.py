@@ -0,0 +1,98 @@
+import asyncio
+import datetime
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, func, insert, select
+from sqlalchemy.exc import IntegrityError
+
+from epg.batching import RATING_BATCH_SIZE, RatingWriter, rating_writer
+from epg.database import storage_models as sm
+from epg.dependencies import Database
+from epg.endpoints import app
+from epg.tests.test_api import DUPLICATE_EMAIL, TEST_EMAIL, delete_match, delete_user, get_user, register_user
+
+
+@pytest.fixture()
+def ratings_database(tmp_path):
+    path = tmp_path / "ratings.db"
+    engine = create_engine(f"sqlite:///{path}")
+    sm.Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(insert(sm.User), [
+            {"avatar": "avatar.png", "gender": "male", "first_name": "John", "last_name": "Doe",
+             "email": f"{i}@example.com", "password": "password", "date": datetime.datetime.now(),
+             "latitude": 0, "longitude": 0}
+            for i in range(3)
+        ])
+    yield Database(f"sqlite+aiosqlite:///{path}"), engine
+    engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_rating_writer_group_commit(ratings_database):
+    database, engine = ratings_database
+    writer = RatingWriter(database, window=0.05)
+    writer.start()
+    now = datetime.datetime.now()
+    batches = RATING_BATCH_SIZE.count()
+
+    results = await asyncio.gather(
+        writer.add(1, 2, now), writer.add(2, 1, now), writer.add(1, 3, now), writer.add(1, 2, now),
+        return_exceptions=True,
+    )
+    assert results[:3] == [None, None, None]
+    assert isinstance(results[3], IntegrityError)
+    assert RATING_BATCH_SIZE.count() == batches + 1
+
+    with pytest.raises(IntegrityError):
+        await writer.add(2, 1, now)
+
+    await writer.stop()
+    await database.dispose()
+    with engine.connect() as conn:
+        assert conn.execute(select(func.count()).select_from(sm.Rating)).scalar() == 3
+
+
+@pytest.mark.asyncio
+async def test_rating_writer_after_stop(ratings_database):
+    database, engine = ratings_database
+    writer = RatingWriter(database, window=0.05)
+    writer.start()
+    now = datetime.datetime.now()
+
+    # Оценка, поставленная в очередь после сигнала остановки, записывается при остановке.
+    results = await asyncio.wait_for(asyncio.gather(writer.stop(), writer.add(1, 2, now)), 5)
+    assert results == [None, None]
+    # После остановки оценки записываются отдельными транзакциями, а не ждут остановленную задачу.
+    await asyncio.wait_for(writer.add(2, 1, now), 5)
+    with pytest.raises(IntegrityError):
+        await asyncio.wait_for(writer.add(2, 1, now), 5)
+
+    await database.dispose()
+    with engine.connect() as conn:
+        assert conn.execute(select(func.count()).select_from(sm.Rating)).scalar() == 2
+
+
+@pytest.mark.asyncio
+async def test_match_with_group_commit(db, monkeypatch):
+    monkeypatch.setattr(rating_writer, "enabled", True)
+    await register_user(TEST_EMAIL)
+    await register_user(DUPLICATE_EMAIL)
+    rater = await get_user(db, TEST_EMAIL)
+    rated = await get_user(db, DUPLICATE_EMAIL)
+
+    with TestClient(app) as client:
+        assert rating_writer.started
+        response = client.post(f"/api/clients/{rated.id}/match", params={"email": TEST_EMAIL})
+        assert response.status_code == 200
+        assert response.json()["message"] == "Оценка добавлена"
+
+        response = client.post(f"/api/clients/{rated.id}/match", params={"email": TEST_EMAIL})
+        assert response.status_code == 400
+        assert response.json()["detail"] == "Вы уже оценили этого участника"
+    assert not rating_writer.started
+
+    await delete_match(db, rater.id, rated.id)
+    await delete_user(db, TEST_EMAIL)
+    await delete_user(db, DUPLICATE_EMAIL)
@@ -0,0 +1,76 @@
+import pytest
+import redis.asyncio as redis
+from fastapi.testclient import TestClient
+
+from epg.cache import LIST_CACHE_BYTES, LIST_CACHE_REQUESTS, list_cache
+from epg.dependencies import storage
+from epg.endpoints import app
+from epg.tests.test_api import DUPLICATE_EMAIL, TEST_EMAIL, avatar_path, delete_user
+
+fakeredis = pytest.importorskip("fakeredis")
+
+
+def register(client: TestClient, email: str):
+    with open(avatar_path, "rb") as avatar_data:
+        return client.post(
+            "/api/clients/create",
+            files={"avatar": ("test.png", avatar_data, "image/png")},
+            data={"gender": "male", "first_name": "John", "last_name": "Doe", "email": email,
+                  "password": "TestPassword123", "latitude": 0, "longitude": 0},
+        )
+
+
+@pytest.mark.asyncio
+async def test_list_cache_invalidated_on_create(db, monkeypatch):
+    monkeypatch.setattr(storage, "client", fakeredis.aioredis.FakeRedis())
+    with TestClient(app) as client:
+        assert register(client, TEST_EMAIL).status_code == 200
+
+        hits = LIST_CACHE_REQUESTS.value(result="hit")
+        first = client.get("/api/list", params={"email": TEST_EMAIL, "gender": "male"})
+        second = client.get("/api/list", params={"email": TEST_EMAIL, "gender": "male"})
+        assert first.status_code == second.status_code == 200
+        assert first.content == second.content
+        assert LIST_CACHE_REQUESTS.value(result="hit") == hits + 1
+        assert LIST_CACHE_BYTES.value() >= len(second.content)
+
+        assert register(client, DUPLICATE_EMAIL).status_code == 200
+        third = client.get("/api/list", params={"email": TEST_EMAIL, "gender": "male"})
+        assert LIST_CACHE_REQUESTS.value(result="hit") == hits + 1
+        assert any(user["email"] == DUPLICATE_EMAIL for user in third.json()["users"])
+
+    await delete_user(db, TEST_EMAIL)
+    await delete_user(db, DUPLICATE_EMAIL)
+
+
+@pytest.mark.asyncio
+async def test_list_cache_errors_do_not_fail_requests(db, monkeypatch):
+    class BrokenRedis(fakeredis.aioredis.FakeRedis):
+        async def execute_command(self, *args, **options):
+            if args[0] != "PING":
+                raise redis.TimeoutError("Timeout reading from socket")
+            return await super().execute_command(*args, **options)
+
+    monkeypatch.setattr(storage, "client", BrokenRedis())
+    with TestClient(app) as client:
+        assert register(client, TEST_EMAIL).status_code == 200
+        response = client.get("/api/list", params={"email": TEST_EMAIL})
+        assert response.status_code == 200
+        assert any(user["email"] == TEST_EMAIL for user in response.json()["users"])
+
+    await delete_user(db, TEST_EMAIL)
+
+
+@pytest.mark.asyncio
+async def test_list_cache_disabled(db, monkeypatch):
+    monkeypatch.setattr(storage, "client", fakeredis.aioredis.FakeRedis())
+    monkeypatch.setattr(list_cache, "enabled", False)
+    with TestClient(app) as client:
+        assert register(client, TEST_EMAIL).status_code == 200
+        hits, misses = LIST_CACHE_REQUESTS.value(result="hit"), LIST_CACHE_REQUESTS.value(result="miss")
+        for _ in range(2):
+            assert client.get("/api/list", params={"email": TEST_EMAIL}).status_code == 200
+        assert LIST_CACHE_REQUESTS.value(result="hit") == hits
+        assert LIST_CACHE_REQUESTS.value(result="miss") == misses
+
+    await delete_user(db, TEST_EMAIL)
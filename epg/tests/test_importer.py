@@ -0,0 +1,36 @@
+import csv
+import os
+
+import pytest
+
+from epg.importer import import_users
+from epg.tests.test_api import avatar_path, delete_user, get_user
+
+IMPORT_EMAILS = ["import0@example.com", "import1@example.com"]
+
+
+@pytest.mark.asyncio
+async def test_import_users_csv(db, tmp_path):
+    path = tmp_path / "users.csv"
+    with path.open("w", newline="") as file:
+        writer = csv.DictWriter(file, fieldnames=["gender", "first_name", "last_name", "email", "password",
+                                                  "latitude", "longitude", "avatar"])
+        writer.writeheader()
+        for email in IMPORT_EMAILS + [IMPORT_EMAILS[0], "not-an-email"]:
+            writer.writerow({"gender": "male", "first_name": "John", "last_name": "Doe", "email": email,
+                             "password": "TestPassword123", "latitude": 1.5, "longitude": 2.5,
+                             "avatar": avatar_path})
+
+    stats = await import_users(str(path), batch_size=2, commit_every=1, workers=1)
+
+    assert stats.read == 4
+    assert stats.inserted == 2
+    assert stats.duplicates == 1
+    assert stats.skipped == 1
+    user = await get_user(db, IMPORT_EMAILS[0])
+    assert user.latitude == 1.5
+    assert user.password != "TestPassword123"
+    assert os.path.exists(user.avatar)
+
+    for email in IMPORT_EMAILS:
+        await delete_user(db, email)
@@ -0,0 +1,44 @@
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from epg.dependencies import Database
+from epg.tests.test_api import TEST_EMAIL, client, delete_user, register_user
+
+
+@pytest.mark.asyncio
+async def test_metrics_and_server_timing(db):
+    response = await register_user(TEST_EMAIL)
+    assert response.status_code == 200
+    timing = response.headers["Server-Timing"]
+    assert "bcrypt;dur=" in timing
+    assert "watermark;dur=" in timing
+    assert "db;dur=" in timing
+    assert "total;dur=" in timing
+
+    response = client.get("/api/list", params={"email": TEST_EMAIL})
+    assert response.status_code == 200
+    assert "db;dur=" in response.headers["Server-Timing"]
+
+    response = client.get("/api/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    body = response.text
+    assert "# TYPE epg_request_duration_seconds histogram" in body
+    assert 'epg_request_duration_seconds_count{method="GET",handler="get_user_list",status="200"}' in body
+    assert 'epg_stage_duration_seconds_bucket{handler="create",stage="bcrypt",le="+Inf"}' in body
+
+    await delete_user(db, TEST_EMAIL)
+
+
+@pytest.mark.asyncio
+async def test_db_timing_after_failed_query(tmp_path):
+    database = Database(f"sqlite+aiosqlite:///{tmp_path / 'errors.db'}")
+    async with database.engine.connect() as conn:
+        with pytest.raises(OperationalError):
+            await conn.execute(text("SELECT * FROM missing"))
+        # Время начала упавшего запроса не должно остаться на стеке и сдвинуть замеры следующих запросов.
+        assert conn.sync_connection.info["query_started"] == []
+        await conn.execute(text("SELECT 1"))
+        assert conn.sync_connection.info["query_started"] == []
+    await database.dispose()
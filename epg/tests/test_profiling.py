@@ -0,0 +1,52 @@
+import logging
+import os
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+from epg.endpoints import app
+from epg.endpoints.middleware import ProfilingMiddleware, SQLProfilingMiddleware
+from epg.request_profiler import summarize
+from epg.sql_profiler import capture
+
+
+def test_profiling_middleware(tmp_path):
+    profiled_client = TestClient(ProfilingMiddleware(app, directory=str(tmp_path), token="secret", sample_rate=0))
+
+    profiled_client.get("/api/list", params={"email": "nobody@example.com"})
+    assert os.listdir(tmp_path) == []
+
+    profiled_client.get("/api/list", params={"email": "nobody@example.com", "gender": "male"},
+                        headers={"X-Profile": "secret"})
+    profiles = os.listdir(tmp_path)
+    assert len(profiles) == 1
+    assert "_GET_get_user_list_email=nobody_40example.com_gender=male.pstats" in profiles[0]
+
+    report = summarize(str(tmp_path), top=5, pattern="get_user_list")
+    assert "Профилей: 1" in report
+    assert "cumulative" in report
+
+
+def test_sql_profiling_middleware(caplog):
+    profiled_client = TestClient(SQLProfilingMiddleware(app))
+    with caplog.at_level(logging.INFO, logger="epg.endpoints.middleware"):
+        profiled_client.get("/api/list", params={"email": "nobody@example.com"})
+
+    message = next(record.getMessage() for record in caplog.records if "SQL-запросов" in record.getMessage())
+    assert message.startswith("GET /api/list: 1 SQL-запросов")
+    assert "самый медленный" in message
+    assert "FROM users" in message
+
+
+def test_sql_profiler_counts_failed_queries():
+    engine = create_engine("sqlite://")
+    with engine.connect() as conn, capture(engine) as stats:
+        with pytest.raises(OperationalError):
+            conn.execute(text("SELECT * FROM missing"))
+        conn.execute(text("SELECT 1"))
+        assert conn.info["query_started"] == []
+    assert stats.count == 2
+    assert "SELECT * FROM missing" in stats.statements
+    engine.dispose()
@@ -0,0 +1,95 @@
+import pytest
+import redis.asyncio as redis
+from fastapi import Depends, FastAPI
+from fastapi.testclient import TestClient
+
+from epg.dependencies import Storage
+from epg.rate_limit import RATE_LIMITED, LocalTokenBucket, RateLimiter, parse_rule, rate_limit
+
+
+def limited_client(limiter: RateLimiter, host: str = "testclient") -> TestClient:
+    app = FastAPI()
+
+    @app.get("/expensive", dependencies=[Depends(limiter)])
+    async def expensive():
+        return {"status": "ok"}
+
+    return TestClient(app, client=(host, 50000))
+
+
+def test_parse_rule():
+    assert parse_rule("20/60") == (20, 60.0)
+    assert parse_rule("5") == (5, 1.0)
+    with pytest.raises(ValueError):
+        parse_rule("0/60")
+
+
+def test_rate_limit_from_env(monkeypatch):
+    assert rate_limit("test_env") == []
+    monkeypatch.setenv("RATE_LIMIT_TEST_ENV", "3/10")
+    limiter = RateLimiter.from_env("test_env")
+    assert (limiter.capacity, limiter.rate) == (3, 0.3)
+
+
+def test_local_token_bucket():
+    bucket = LocalTokenBucket(capacity=2, rate=1)
+    assert bucket.take("a", now=0) == 0
+    assert bucket.take("a", now=0) == 0
+    assert bucket.take("a", now=0) == pytest.approx(1)
+    assert bucket.take("b", now=0) == 0
+    assert bucket.take("a", now=1.5) == 0
+
+
+def test_rate_limit_redis():
+    fakeredis = pytest.importorskip("fakeredis")
+    pytest.importorskip("lupa")
+    storage = Storage(None)
+    storage.client = fakeredis.aioredis.FakeRedis()
+    limiter = RateLimiter("test_redis", capacity=2, period=60, storage=storage)
+    client = limited_client(limiter)
+
+    limited = RATE_LIMITED.value(rule="test_redis", backend="redis")
+    assert client.get("/expensive", params={"email": "a@example.com"}).status_code == 200
+    assert client.get("/expensive", params={"email": "a@example.com"}).status_code == 200
+    response = client.get("/expensive", params={"email": "a@example.com"})
+    assert response.status_code == 429
+    assert 1 <= int(response.headers["Retry-After"]) <= 30
+    assert RATE_LIMITED.value(rule="test_redis", backend="redis") == limited + 1
+
+    # Другая почта с того же IP-адреса не обходит ограничение, а та же почта с другого адреса ограничена по почте.
+    assert client.get("/expensive", params={"email": "b@example.com"}).status_code == 429
+    other = limited_client(limiter, host="10.0.0.2")
+    assert other.get("/expensive", params={"email": "a@example.com"}).status_code == 429
+    assert other.get("/expensive", params={"email": "b@example.com"}).status_code == 200
+
+
+def test_rate_limit_falls_back_without_redis():
+    storage = Storage("redis://localhost:6399")
+    limiter = RateLimiter("test_local", capacity=1, period=60, storage=storage,
+                          when=lambda request: "distance" in request.query_params)
+    client = limited_client(limiter)
+
+    assert client.get("/expensive").status_code == 200
+    assert client.get("/expensive").status_code == 200
+    assert client.get("/expensive", params={"distance": 5}).status_code == 200
+    response = client.get("/expensive", params={"distance": 5})
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "60"
+    assert RATE_LIMITED.value(rule="test_local", backend="local") == 1
+
+
+def test_rate_limit_falls_back_on_redis_errors():
+    fakeredis = pytest.importorskip("fakeredis")
+
+    class TimingOutRedis(fakeredis.aioredis.FakeRedis):
+        async def execute_command(self, *args, **options):
+            raise redis.TimeoutError("Timeout reading from socket")
+
+    storage = Storage(None)
+    storage.client = TimingOutRedis()
+    limiter = RateLimiter("test_timeout", capacity=1, period=60, storage=storage)
+    client = limited_client(limiter)
+
+    assert client.get("/expensive").status_code == 200
+    assert client.get("/expensive").status_code == 429
+    assert RATE_LIMITED.value(rule="test_timeout", backend="local") == 1
@@ -0,0 +1,117 @@
+import datetime
+
+import pytest
+from sqlalchemy import create_engine, insert
+
+from epg.database import storage_models as sm
+from epg.dependencies import DB_READS, Database, Storage, database, storage
+from epg.endpoints import app
+from epg.tests.test_api import TEST_EMAIL, client, register_user
+
+REPLICA_EMAIL = "replica@example.com"
+
+
+@pytest.fixture()
+def replicated(tmp_path):
+    """
+    Подменяет базу приложения основной базой и репликой в двух файлах SQLite. Репликация не настроена:
+    пользователь REPLICA_EMAIL есть только в реплике, поэтому по ответу видно, откуда выполнено чтение.
+    """
+    links = {}
+    for name in ("primary", "replica"):
+        path = tmp_path / f"{name}.db"
+        engine = create_engine(f"sqlite:///{path}")
+        sm.Base.metadata.create_all(engine)
+        if name == "replica":
+            with engine.begin() as conn:
+                conn.execute(insert(sm.User).values(
+                    avatar="avatar.png", gender="female", first_name="Jane", last_name="Doe", email=REPLICA_EMAIL,
+                    password="password", date=datetime.datetime.now(), latitude=0, longitude=0))
+        engine.dispose()
+        links[name] = f"sqlite+aiosqlite:///{path}"
+
+    replicated_database = Database(links["primary"], replica_links=[links["replica"]], read_your_writes=60)
+    app.dependency_overrides[database] = replicated_database
+    app.dependency_overrides[database.reader] = replicated_database.reader
+    yield replicated_database
+    app.dependency_overrides.clear()
+
+
+@pytest.mark.asyncio
+async def test_pin_expires():
+    db = Database("sqlite+aiosqlite://", replica_links=["sqlite+aiosqlite://"], read_your_writes=0)
+    await db.pin("a@example.com")
+    assert not await db.pinned("a@example.com")
+    db.read_your_writes = 60
+    await db.pin("A@example.com")
+    assert await db.pinned("a@example.com")
+    assert not await db.pinned("b@example.com")
+
+
+@pytest.mark.asyncio
+async def test_pin_shared_between_instances():
+    fakeredis = pytest.importorskip("fakeredis")
+    shared = Storage(None)
+    shared.client = fakeredis.aioredis.FakeRedis()
+    # Два экземпляра Database с общим Redis — как два процесса uvicorn.
+    first, second = (Database("sqlite+aiosqlite://", replica_links=["sqlite+aiosqlite://"], read_your_writes=60,
+                              storage=shared) for _ in range(2))
+    await first.pin("a@example.com")
+    assert await second.pinned("a@example.com")
+    assert not await second.pinned("b@example.com")
+
+    # Без Redis закрепление остаётся в памяти процесса, где выполнена запись.
+    unavailable = Storage("redis://localhost:6399")
+    first.storage = second.storage = unavailable
+    await first.pin("b@example.com")
+    assert await first.pinned("b@example.com")
+    assert not await second.pinned("b@example.com")
+
+
+@pytest.mark.asyncio
+async def test_reads_routed_to_replica_until_write(replicated):
+    replica_reads = DB_READS.value(target="replica")
+    response = client.get("/api/list", params={"email": REPLICA_EMAIL})
+    assert response.status_code == 200
+    assert DB_READS.value(target="replica") == replica_reads + 1
+
+    # После регистрации клиент читает из основной базы: на реплике его ещё нет. Остальные клиенты с того же
+    # адреса по-прежнему читают с реплики.
+    assert (await register_user(TEST_EMAIL)).status_code == 200
+    primary_reads = DB_READS.value(target="primary")
+    assert client.get("/api/list", params={"email": TEST_EMAIL}).status_code == 200
+    assert DB_READS.value(target="primary") == primary_reads + 1
+    assert client.get("/api/list", params={"email": REPLICA_EMAIL}).status_code == 200
+    assert DB_READS.value(target="replica") == replica_reads + 2
+
+    await replicated.dispose()
+
+
+@pytest.mark.asyncio
+async def test_match_batch_reads_users_from_replica(replicated):
+    replica_user = client.get("/api/list", params={"email": REPLICA_EMAIL}).json()["users"][0]
+    # Все пользователи пакета, включая самого оценивающего, есть на реплике: основная база для поиска не нужна.
+    response = client.post("/api/clients/match", params={"email": REPLICA_EMAIL}, json={"ids": [replica_user["id"]]})
+    assert response.status_code == 200
+    assert response.json()["results"] == [{"id": replica_user["id"], "status": "self"}]
+
+    await replicated.dispose()
+
+
+@pytest.mark.asyncio
+async def test_list_cache_keyed_by_replica_state(replicated, monkeypatch):
+    fakeredis = pytest.importorskip("fakeredis")
+    monkeypatch.setattr(storage, "client", fakeredis.aioredis.FakeRedis())
+    assert client.get("/api/list", params={"email": REPLICA_EMAIL}).json()["users"][0]["email"] == REPLICA_EMAIL
+
+    # Реплика догнала основную базу: ответ, закэшированный по её прежнему состоянию, не должен использоваться.
+    engine = create_engine(replicated.replica_links[0].replace("+aiosqlite", ""))
+    with engine.begin() as conn:
+        conn.execute(insert(sm.User).values(
+            avatar="avatar.png", gender="male", first_name="John", last_name="Doe", email=TEST_EMAIL,
+            password="password", date=datetime.datetime.now(), latitude=0, longitude=0))
+    engine.dispose()
+    response = client.get("/api/list", params={"email": REPLICA_EMAIL})
+    assert TEST_EMAIL in [user["email"] for user in response.json()["users"]]
+
+    await replicated.dispose()
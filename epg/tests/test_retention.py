@@ -0,0 +1,101 @@
+import asyncio
+import datetime
+
+import pytest
+from sqlalchemy import create_engine, delete, func, insert, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from epg import cli
+from epg.batching import RatingWriter
+from epg.database import storage_models as sm
+from epg.dependencies import Database
+from epg.retention import RatingArchiver, rating_exists
+from epg.tests.test_api import DUPLICATE_EMAIL, TEST_EMAIL, client, delete_user, get_user, register_user
+
+OLD = datetime.datetime.now() - datetime.timedelta(days=40)
+
+
+def count(conn, model) -> int:
+    return conn.execute(select(func.count()).select_from(model)).scalar()
+
+
+@pytest.mark.asyncio
+async def test_archive_ratings(tmp_path):
+    path = tmp_path / "retention.db"
+    engine = create_engine(f"sqlite:///{path}")
+    sm.Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(insert(sm.User), [
+            {"avatar": "avatar.png", "gender": "male", "first_name": "John", "last_name": "Doe",
+             "email": f"{i}@example.com", "password": "password", "date": OLD, "latitude": 0, "longitude": 0}
+            for i in range(3)
+        ])
+        conn.execute(insert(sm.Rating), [
+            {"rater_id": 1, "rated_id": 2, "date": OLD},
+            {"rater_id": 1, "rated_id": 3, "date": OLD},
+            {"rater_id": 2, "rated_id": 1, "date": datetime.datetime.now()},
+        ])
+    database = Database(f"sqlite+aiosqlite:///{path}")
+
+    with pytest.raises(ValueError):
+        RatingArchiver(database, retention=datetime.timedelta(hours=1))
+    stats = await RatingArchiver(database, retention=datetime.timedelta(days=30), batch_size=1, pause=0).run()
+    assert (stats.moved, stats.batches) == (2, 2)
+    with engine.connect() as conn:
+        assert (count(conn, sm.Rating), count(conn, sm.RatingArchive), count(conn, sm.RatingPair)) == (1, 2, 2)
+        assert conn.execute(select(rating_exists(1, 2))).scalar()
+        assert not conn.execute(select(rating_exists(3, 1))).scalar()
+
+    writer = RatingWriter(database, window=0)
+    writer.start()
+    with pytest.raises(IntegrityError):
+        await writer.add(1, 2, datetime.datetime.now())
+    await writer.stop()
+    await database.dispose()
+    engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_archive_lock(tmp_path):
+    # Два воркера с одной базой: переносит только получивший блокировку.
+    databases = [Database(f"sqlite+aiosqlite:///{tmp_path / 'lock.db'}") for _ in range(2)]
+    first, second = [RatingArchiver(database, retention=datetime.timedelta(days=30)) for database in databases]
+    async with first.lock() as locked:
+        assert locked
+        async with second.lock() as locked:
+            assert not locked
+    async with second.lock() as locked:
+        assert locked
+    for database in databases:
+        await database.dispose()
+
+
+@pytest.mark.asyncio
+async def test_archived_ratings_in_match(db):
+    await register_user(TEST_EMAIL)
+    await register_user(DUPLICATE_EMAIL)
+    rater = await get_user(db, TEST_EMAIL)
+    rated = await get_user(db, DUPLICATE_EMAIL)
+    async with AsyncSession(db) as session:
+        session.add(sm.Rating(rater_id=rater.id, rated_id=rated.id, date=OLD))
+        await session.commit()
+
+    await asyncio.to_thread(cli.main, ["archive-ratings", "--days", "30", "--pause-ms", "0"])
+
+    response = client.post(f"/api/clients/{rated.id}/match", params={"email": TEST_EMAIL})
+    assert response.json()["detail"] == "Вы уже оценили этого участника"
+    response = client.post("/api/clients/match", params={"email": TEST_EMAIL}, json={"ids": [rated.id]})
+    assert response.json()["results"] == [{"id": rated.id, "status": "already_rated"}]
+    response = client.get("/api/list", params={"email": TEST_EMAIL, "exclude_rated": True})
+    assert DUPLICATE_EMAIL not in [user["email"] for user in response.json()["users"]]
+
+    response = client.post(f"/api/clients/{rater.id}/match", params={"email": DUPLICATE_EMAIL})
+    assert response.json()["message"] == "Взаимная симпатия! Проверьте почту"
+
+    async with AsyncSession(db) as session:
+        for model in (sm.Rating, sm.RatingPair, sm.RatingArchive):
+            await session.execute(delete(model).where(model.rater_id.in_([rater.id, rated.id])))
+        await session.commit()
+    await delete_user(db, TEST_EMAIL)
+    await delete_user(db, DUPLICATE_EMAIL)